@@ -0,0 +1,143 @@
+import argparse
+import heapq
+import json
+import os
+import time
+import numpy as np
+
+from obstacle_map import random_map
+from path_solver import load_model, solve_paths
+
+# Shortest route from start to end on a barrier map ((rows, cols) booleans
+# indexed [x, y]) moving up, down, left and right. Blocks are numbered
+# x*cols + y and the open set is a binary heap ordered by f = g + Manhattan
+# distance, ties going to the block furthest from the start. Returns the
+# (x, y) blocks of the route, start and end included, or None when the end
+# cannot be reached. Flattening the map costs time in proportion to its area,
+# so callers with many routes on one map pass flatten_map(barriers) once as
+# `blocked`.
+def astar(barriers, start, end, blocked=None):
+    num_rows, num_cols = barriers.shape
+    if blocked is None:
+        blocked = flatten_map(barriers)
+    start_x, start_y = int(start[0]), int(start[1])
+    end_x, end_y = int(end[0]), int(end[1])
+    source = start_x*num_cols + start_y
+    target = end_x*num_cols + end_y
+    if blocked[source] or blocked[target]:
+        return None
+
+    cost = {source: 0}
+    came_from = {}
+    closed = set()
+    heap = [(abs(start_x - end_x) + abs(start_y - end_y), 0, source)]
+    while heap:
+        _, g, node = heapq.heappop(heap)
+        if node == target:
+            path = [node]
+            while node != source:
+                node = came_from[node]
+                path.append(node)
+            return [divmod(n, num_cols) for n in reversed(path)]
+        if node in closed:
+            continue
+        closed.add(node)
+
+        g = -g + 1
+        x, y = divmod(node, num_cols)
+        for nx, ny in ((x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)):
+            if 0 <= nx < num_rows and 0 <= ny < num_cols:
+                neighbour = nx*num_cols + ny
+                if not blocked[neighbour] and neighbour not in closed and g < cost.get(neighbour, g + 1):
+                    cost[neighbour] = g
+                    came_from[neighbour] = node
+                    heapq.heappush(heap, (g + abs(nx - end_x) + abs(ny - end_y), -g, neighbour))
+    return None
+
+# barrier map as the flat list of booleans astar() indexes by block number
+def flatten_map(barriers):
+    return np.asarray(barriers, dtype=bool).ravel().tolist()
+
+# Run A* and the compiled network on the same random maps and routes. Every
+# map gets `queries` routes that A* can solve; A* solves them one by one (on
+# the map flattened once, outside the timer) and the network in one batched
+# call per map. Returns a dict of the results.
+def compare(net, num_rows, maps, queries, density, seed=0):
+    rng = np.random.default_rng(seed)
+    astar_times = []
+    nn_times = []
+    astar_lengths = []
+    nn_lengths = []
+    nn_success = []
+    for i in range(maps):
+        barriers = random_map(num_rows, density, rng.integers(1 << 32))
+        free = np.argwhere(~barriers)
+        if len(free) < 2:
+            continue
+
+        blocked = flatten_map(barriers)
+        starts, ends, lengths = [], [], []
+        attempts = 0
+        while len(starts) < queries and attempts < 20*queries:
+            attempts += 1
+            start, end = free[rng.choice(len(free), 2, replace=False)]
+            t = time.perf_counter()
+            path = astar(barriers, start, end, blocked)
+            seconds = time.perf_counter() - t
+            if path is not None:
+                astar_times.append(seconds)
+                starts.append(start)
+                ends.append(end)
+                lengths.append(len(path) - 1)
+        if not starts:
+            continue
+
+        t = time.perf_counter()
+        paths, success = solve_paths(net, np.array(starts), np.array(ends), num_rows, barriers if density > 0 else None)
+        nn_times.append((time.perf_counter() - t) / len(starts))
+        astar_lengths.extend(lengths)
+        nn_lengths.extend(len(p) - 1 for p in paths)
+        nn_success.extend(success.tolist())
+
+    astar_times = np.array(astar_times)
+    nn_times = np.array(nn_times)
+    nn_success = np.array(nn_success, dtype=bool)
+    ratios = np.array(nn_lengths)[nn_success] / np.array(astar_lengths)[nn_success]
+    return {
+        'rows': num_rows,
+        'maps': maps,
+        'queries': int(len(nn_success)),
+        'density': density,
+        'astar_ms_mean': astar_times.mean()*1000,
+        'astar_ms_p50': np.percentile(astar_times, 50)*1000,
+        'astar_ms_p99': np.percentile(astar_times, 99)*1000,
+        'nn_ms_per_query': nn_times.mean()*1000,
+        'nn_success_rate': nn_success.mean(),
+        'optimality_ratio_mean': ratios.mean() if len(ratios) else None,
+        'optimality_ratio_max': ratios.max() if len(ratios) else None,
+        'optimal_share': (ratios == 1).mean() if len(ratios) else None,
+    }
+
+if __name__ == "__main__":
+    local_dir = os.path.dirname(__file__) # gives path to current directory
+    parser = argparse.ArgumentParser(description="Compare the trained network with A* on random barrier maps")
+    parser.add_argument("--model", default=os.path.join(local_dir, "winner.npz"))
+    parser.add_argument("--rows", type=int, default=30)
+    parser.add_argument("--maps", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=4, help="routes per map")
+    parser.add_argument("--density", type=float, default=0.2, help="share of barrier blocks (0 for open grids)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    results = compare(load_model(args.model), args.rows, args.maps, args.queries, args.density, args.seed)
+    print("{0} routes on {1} random {2}x{2} maps ({3:.0%} barriers)".format(results['queries'], args.maps, args.rows, args.density))
+    print("A*:      {0:.3f} ms per route (p50 {1:.3f} ms, p99 {2:.3f} ms), always optimal".format(results['astar_ms_mean'], results['astar_ms_p50'], results['astar_ms_p99']))
+    print("Network: {0:.3f} ms per route (batched per map), {1:.2%} solved".format(results['nn_ms_per_query'], results['nn_success_rate']))
+    if results['optimality_ratio_mean'] is not None:
+        print("Solved routes are {0:.3f}x the A* length on average (worst {1:.2f}x), {2:.2%} optimal".format(
+            results['optimality_ratio_mean'], results['optimality_ratio_max'], results['optimal_share']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Saved results to", args.output)
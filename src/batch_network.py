@@ -0,0 +1,160 @@
+import numpy as np
+
+# version of the .npz layout written by BatchNetwork.save
+MODEL_VERSION = 1
+
+# numpy versions of the neat activation functions, with the same clamping
+def sigmoid_activation(z):
+    z = np.clip(5.0 * z, -60.0, 60.0)
+    return 1.0 / (1.0 + np.exp(-z))
+
+def tanh_activation(z):
+    return np.tanh(np.clip(2.5 * z, -60.0, 60.0))
+
+def relu_activation(z):
+    return np.maximum(z, 0.0)
+
+def identity_activation(z):
+    return z
+
+ACTIVATIONS = [sigmoid_activation, tanh_activation, relu_activation, identity_activation]
+ACTIVATION_NAMES = ['sigmoid', 'tanh', 'relu', 'identity']
+
+# names of the per-layer arrays in a saved network
+LAYER_ARRAYS = ['weights', 'biases', 'responses', 'targets', 'activations']
+
+
+# Feed-forward networks of a whole generation evaluated together.
+#
+# Every genome gets a row of value slots laid out as [inputs, outputs, hidden,
+# scratch]. Nodes are grouped by topological layer across genomes; layer L
+# holds a (genomes, nodes, slots) weight matrix, so one einsum per layer
+# evaluates that layer for every live agent. Genomes with fewer nodes in a
+# layer are padded with zero-weight nodes that write to the scratch slot.
+class BatchNetwork:
+    def __init__(self, num_inputs, num_outputs, num_slots, layers):
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.num_slots = num_slots
+        # each layer is (weights, biases, responses, targets, activations)
+        self.layers = layers
+
+    @staticmethod
+    def create(genomes, config):
+        # neat is only needed to compile genomes, not to run saved networks
+        from neat.graphs import feed_forward_layers
+
+        genome_config = config.genome_config
+        input_keys = genome_config.input_keys
+        output_keys = genome_config.output_keys
+        num_inputs = len(input_keys)
+        num_outputs = len(output_keys)
+
+        compiled = []
+        max_hidden = 0
+        depth = 0
+        for g in genomes:
+            connections = [cg.key for cg in g.connections.values() if cg.enabled]
+            layers = [sorted(layer) for layer in feed_forward_layers(input_keys, output_keys, connections)]
+
+            slots = {}
+            for i, key in enumerate(input_keys):
+                slots[key] = i
+            for i, key in enumerate(output_keys):
+                slots[key] = num_inputs + i
+            for layer in layers:
+                for node in layer:
+                    if node not in slots:
+                        slots[node] = len(slots)
+
+            compiled.append((g, connections, layers, slots))
+            max_hidden = max(max_hidden, len(slots) - num_inputs - num_outputs)
+            depth = max(depth, len(layers))
+
+        num_slots = num_inputs + num_outputs + max_hidden + 1
+        scratch = num_slots - 1
+        pop_size = len(compiled)
+
+        batch_layers = []
+        for level in range(depth):
+            width = max([len(layers[level]) for _, _, layers, _ in compiled if level < len(layers)])
+            batch_layers.append((np.zeros((pop_size, width, num_slots)),
+                                 np.zeros((pop_size, width)),
+                                 np.zeros((pop_size, width)),
+                                 np.full((pop_size, width), scratch, dtype=np.int64),
+                                 np.zeros((pop_size, width), dtype=np.int64)))
+
+        for row, (g, connections, layers, slots) in enumerate(compiled):
+            positions = {}
+            for level, layer in enumerate(layers):
+                weights, biases, responses, targets, activations = batch_layers[level]
+                for col, node in enumerate(layer):
+                    ng = g.nodes[node]
+                    if ng.aggregation != 'sum':
+                        raise ValueError("Unsupported aggregation for batch evaluation: {0}".format(ng.aggregation))
+                    if ng.activation not in ACTIVATION_NAMES:
+                        raise ValueError("Unsupported activation for batch evaluation: {0}".format(ng.activation))
+                    biases[row, col] = ng.bias
+                    responses[row, col] = ng.response
+                    targets[row, col] = slots[node]
+                    activations[row, col] = ACTIVATION_NAMES.index(ng.activation)
+                    positions[node] = (level, col)
+
+            for inode, onode in connections:
+                if onode in positions:
+                    level, col = positions[onode]
+                    batch_layers[level][0][row, col, slots[inode]] = g.connections[inode, onode].weight
+
+        return BatchNetwork(num_inputs, num_outputs, num_slots, batch_layers)
+
+    # write the compiled arrays to a self-contained .npz file
+    def save(self, path):
+        arrays = {'version': MODEL_VERSION,
+                  'shape': np.array([self.num_inputs, self.num_outputs, self.num_slots, len(self.layers)])}
+        for level, layer in enumerate(self.layers):
+            for name, array in zip(LAYER_ARRAYS, layer):
+                arrays['{0}_{1}'.format(name, level)] = array
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            if int(data['version']) != MODEL_VERSION:
+                raise ValueError("Unsupported model version {0} in {1}".format(int(data['version']), path))
+            num_inputs, num_outputs, num_slots, depth = data['shape'].tolist()
+            layers = [tuple(data['{0}_{1}'.format(name, level)] for name in LAYER_ARRAYS) for level in range(depth)]
+        return BatchNetwork(num_inputs, num_outputs, num_slots, layers)
+
+    # inputs is an (agents, num_inputs) array; agents selects the genome rows
+    # they belong to (all genomes when None). A network compiled from a single
+    # genome is shared by every row. Returns (agents, num_outputs).
+    def activate(self, inputs, agents=None):
+        inputs = np.asarray(inputs, dtype=np.float64)
+        values = np.zeros((inputs.shape[0], self.num_slots))
+        values[:, :self.num_inputs] = inputs
+        rows = np.arange(inputs.shape[0])[:, None]
+
+        for weights, biases, responses, targets, activations in self.layers:
+            if agents is not None:
+                weights = weights[agents]
+                biases = biases[agents]
+                responses = responses[agents]
+                targets = targets[agents]
+                activations = activations[agents]
+
+            if len(weights) == 1:
+                z = biases + responses * (values @ weights[0].T)
+            else:
+                z = biases + responses * np.einsum('gns,gs->gn', weights, values)
+            if not activations.any():
+                out = sigmoid_activation(z)
+            else:
+                activations = np.broadcast_to(activations, z.shape)
+                out = np.empty_like(z)
+                for code in np.unique(activations):
+                    mask = activations == code
+                    out[mask] = ACTIVATIONS[code](z[mask])
+            values[rows, targets] = out
+
+        return values[:, self.num_inputs:self.num_inputs + self.num_outputs]
@@ -0,0 +1,288 @@
+import argparse
+import copy
+import json
+import os
+import pickle
+import platform
+import random
+import sys
+import time
+import numpy as np
+import neat
+
+from pathfinder_env import make_grid, combineGrids, moveUp, moveDown, moveLeft, moveRight
+from batch_network import BatchNetwork
+from evaluator import ScenarioSchedule, EpisodeLimits, make_scenarios, simulate
+from fitness_cache import FitnessCache
+
+WIDTH = 900
+TILES = 25
+GRID_SIZES = [12, 30, 100, 500]
+POP_SIZES = [25, 100, 1000]
+BENCHMARKS = ['make_grid', 'move', 'combineGrids', 'draw', 'render_step', 'activate', 'batch_activate', 'simulate', 'generation']
+
+# call fn until min_time has been spent inside it and return the mean time
+# of one call; setup runs untimed before every call
+def time_calls(fn, setup=None, min_time=0.2):
+    calls = 0
+    spent = 0.0
+    while spent < min_time:
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        fn()
+        spent += time.perf_counter() - t
+        calls += 1
+    return spent / calls
+
+# population of perturbed copies of the trained winner, which survive long
+# enough to exercise the whole fitness loop; random genomes when no winner
+def make_genomes(config, pop_size, winner_path, seed):
+    rng = random.Random(seed)
+    if winner_path is None or not os.path.exists(winner_path):
+        random.seed(seed)
+        genomes = []
+        for key in range(pop_size):
+            g = config.genome_type(key)
+            g.configure_new(config.genome_config)
+            genomes.append(g)
+        return genomes
+
+    with open(winner_path, 'rb') as f:
+        winner = pickle.load(f)
+    genomes = []
+    for key in range(pop_size):
+        g = copy.deepcopy(winner)
+        g.key = key
+        if key:
+            for cg in g.connections.values():
+                cg.weight += rng.gauss(0, 0.2)
+        genomes.append(g)
+    return genomes
+
+# counts the lockstep steps of a simulated generation
+class StepCounter:
+    def __init__(self):
+        self.steps = 0
+
+    def on_round(self, grid, level, fitness=None):
+        pass
+
+    def on_step(self, grid, level):
+        self.steps += 1
+
+class Benchmarks:
+    def __init__(self, config, args):
+        self.config = config
+        self.args = args
+        self.results = []
+        self.genomes = {}
+        self.pygame = None
+
+    def record(self, name, rows, pop, seconds, unit, **extra):
+        result = {'name': name, 'rows': rows, 'pop': pop, 'seconds': seconds, 'rate': 1.0 / seconds, 'unit': unit}
+        result.update(extra)
+        self.results.append(result)
+        label = name + '/' + extra['function'] if 'function' in extra else name
+        print("{0:<20} rows={1!s:<5} pop={2!s:<5} {3:12.6f} ms  {4:14.1f} {5}".format(label, rows, pop, seconds*1000, 1.0 / seconds, unit))
+
+    def skip(self, name, rows, pop, reason):
+        self.results.append({'name': name, 'rows': rows, 'pop': pop, 'skipped': reason})
+        print("{0:<20} rows={1!s:<5} pop={2!s:<5} skipped: {3}".format(name, rows, pop, reason))
+
+    def population(self, pop_size):
+        if pop_size not in self.genomes:
+            self.genomes[pop_size] = make_genomes(self.config, pop_size, self.args.winner, self.args.seed)
+        return self.genomes[pop_size]
+
+    # pygame is only started for the drawing benchmarks, on a dummy display
+    def display(self):
+        if self.pygame is None:
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            import pygame
+            pygame.init()
+            pygame.font.init()
+            self.pygame = pygame
+            self.win = pygame.display.set_mode((WIDTH, WIDTH))
+            self.font = pygame.font.SysFont("comicsans", 50)
+        return self.pygame
+
+    def grid(self, rows, pop):
+        grid = make_grid(rows, pop)
+        centre = rows // 2
+        grid.reset(centre, centre, 0, 0)
+        return grid
+
+    def bench_make_grid(self, rows, pop):
+        self.record('make_grid', rows, pop, time_calls(lambda: make_grid(rows, pop), min_time=self.args.min_time), 'grids/s')
+
+    # one call moves every agent of the population once
+    def bench_move(self, rows, pop):
+        grid = self.grid(rows, pop)
+        centre = np.full(pop, rows // 2)
+        for name, fn in (('moveUp', moveUp), ('moveDown', moveDown), ('moveLeft', moveLeft), ('moveRight', moveRight)):
+            seconds = time_calls(lambda: fn(centre, centre, grid), lambda: grid.reset(rows // 2, rows // 2, 0, 0), self.args.min_time)
+            self.record('move', rows, pop, seconds, 'steps/s', function=name, agent_steps_per_sec=pop / seconds)
+
+    def bench_combineGrids(self, rows, pop):
+        grid = self.grid(rows, pop)
+        self.record('combineGrids', rows, pop, time_calls(lambda: combineGrids(grid), min_time=self.args.min_time), 'frames/s')
+
+    def bench_draw(self, rows, pop):
+        comb_rows = int(np.sqrt(pop))*rows
+        if comb_rows > WIDTH:
+            self.skip('draw', rows, pop, 'more blocks than pixels')
+            return
+        self.display()
+        from training_renderer import draw
+        comb_cells = combineGrids(self.grid(rows, pop))
+        seconds = time_calls(lambda: draw(self.win, comb_cells, comb_rows, WIDTH, rows, 1, self.font), min_time=self.args.min_time)
+        self.record('draw', rows, pop, seconds, 'frames/s')
+
+    # incremental frame after every agent made one move, with the default
+    # number of tiles shown
+    def bench_render_step(self, rows, pop):
+        if int(np.sqrt(min(pop, TILES)))*rows > WIDTH:
+            self.skip('render_step', rows, pop, 'more blocks than pixels')
+            return
+        self.display()
+        from training_renderer import TrainingRenderer
+        renderer = TrainingRenderer(WIDTH, rows, pop, fps=0, max_tiles=TILES)
+        grid = self.grid(rows, pop)
+        centre = np.full(pop, rows // 2)
+        fitness = np.random.default_rng(self.args.seed).random(pop)
+
+        def setup():
+            grid.reset(rows // 2, rows // 2, 0, 0)
+            renderer.on_round(grid, 1, fitness)
+            moveUp(centre, centre, grid)
+
+        seconds = time_calls(lambda: renderer.on_step(grid, 1), setup, self.args.min_time)
+        self.record('render_step', rows, pop, seconds, 'frames/s')
+
+    # one call activates every network of the population once
+    def bench_activate(self, pop):
+        nets = [neat.nn.FeedForwardNetwork.create(g, self.config) for g in self.population(pop)]
+        inputs = (0.5, -0.5, 0.25, -0.25)
+
+        def step():
+            for net in nets:
+                net.activate(inputs)
+
+        seconds = time_calls(step, min_time=self.args.min_time)
+        self.record('activate', None, pop, seconds, 'steps/s', agent_steps_per_sec=pop / seconds)
+
+    def bench_batch_activate(self, pop):
+        net = BatchNetwork.create(self.population(pop), self.config)
+        inputs = np.tile([0.5, -0.5, 0.25, -0.25], (pop, 1))
+        seconds = time_calls(lambda: net.activate(inputs), min_time=self.args.min_time)
+        self.record('batch_activate', None, pop, seconds, 'steps/s', agent_steps_per_sec=pop / seconds)
+
+    # the fitness loop alone: every round of one scenario list played by the
+    # whole population, without scenario building, cache or step limits
+    def bench_simulate(self, rows, pop):
+        genomes = self.population(pop)
+        scenarios = make_scenarios(rows, self.args.seed, self.args.rounds)
+        counter = StepCounter()
+        t = time.perf_counter()
+        simulate(genomes, self.config, scenarios, rows, renderer=counter)
+        seconds = time.perf_counter() - t
+        self.record('simulate', rows, pop, seconds, 'generations/s', rounds=self.args.rounds,
+                    steps=counter.steps, steps_per_sec=counter.steps / seconds)
+
+    # one full fitness evaluation of the population as training runs it:
+    # main() with the scenario schedule, an empty fitness cache and the
+    # default step limits
+    def bench_generation(self, rows, pop):
+        from nn_pathfinder_train import main
+        genomes = list(enumerate(self.population(pop)))
+        schedule = ScenarioSchedule(rows, self.args.rounds, fixed_seed=self.args.seed)
+        counter = StepCounter()
+        t = time.perf_counter()
+        main(genomes, self.config, renderer=counter, cache=FitnessCache(), schedule=schedule, limits=EpisodeLimits())
+        seconds = time.perf_counter() - t
+        self.record('generation', rows, pop, seconds, 'generations/s', rounds=self.args.rounds,
+                    steps=counter.steps, steps_per_sec=counter.steps / seconds)
+
+    def run(self):
+        selected = self.args.only or BENCHMARKS
+        for pop in self.args.pops:
+            if 'activate' in selected:
+                self.bench_activate(pop)
+            if 'batch_activate' in selected:
+                self.bench_batch_activate(pop)
+            for rows in self.args.rows:
+                if pop * rows * rows > self.args.max_cells:
+                    for name in selected:
+                        if name not in ('activate', 'batch_activate'):
+                            self.skip(name, rows, pop, 'grid larger than --max-cells')
+                    continue
+                for name in selected:
+                    if name not in ('activate', 'batch_activate'):
+                        getattr(self, 'bench_' + name)(rows, pop)
+        return self.results
+
+def result_key(result):
+    return (result['name'], result.get('function'), result['rows'], result['pop'])
+
+# compare the rates of two result files and return the regressions, i.e. the
+# benchmarks whose rate dropped by more than the tolerance
+def compare(results, baseline, tolerance):
+    previous = dict((result_key(r), r) for r in baseline['results'] if 'rate' in r)
+    regressions = []
+    print("\n{0:<30} {1:>14} {2:>14} {3:>8}".format('benchmark', 'baseline', 'current', 'change'))
+    for result in results:
+        old = previous.get(result_key(result))
+        if 'rate' not in result or old is None:
+            continue
+        change = result['rate'] / old['rate'] - 1
+        label = "{0}{1} rows={2} pop={3}".format(result['name'], '/' + result['function'] if result.get('function') else '', result['rows'], result['pop'])
+        flag = ''
+        if change < -tolerance:
+            regressions.append((label, old['rate'], result['rate']))
+            flag = '  REGRESSION'
+        print("{0:<30} {1:14.1f} {2:14.1f} {3:+7.1%}{4}".format(label, old['rate'], result['rate'], change, flag))
+    return regressions
+
+if __name__ == "__main__":
+    local_dir = os.path.dirname(__file__) # gives path to current directory
+    parser = argparse.ArgumentParser(description="Benchmark the pathfinder environment, inference and rendering")
+    parser.add_argument("--rows", type=int, nargs='+', default=GRID_SIZES, help="grid sizes to benchmark")
+    parser.add_argument("--pops", type=int, nargs='+', default=POP_SIZES, help="population sizes to benchmark")
+    parser.add_argument("--only", nargs='+', choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--rounds", type=int, default=50, help="rounds per simulated generation")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds spent timing each benchmark")
+    parser.add_argument("--max-cells", type=int, default=100000000, help="skip grids with more cells than this over the whole population")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default=os.path.join(local_dir, "neat-config.txt"))
+    parser.add_argument("--winner", default=os.path.join(local_dir, "winner.pkl"), help="genome the benchmark population is derived from")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative drop in rate before a result counts as a regression")
+    args = parser.parse_args()
+
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, args.config)
+    results = Benchmarks(config, args).run()
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'rounds': args.rounds,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Saved results to", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("{0} benchmark(s) regressed by more than {1:.0%}".format(len(regressions), args.tolerance))
+            sys.exit(1)
@@ -0,0 +1,145 @@
+import itertools
+import json
+import os
+import random
+import numpy as np
+import neat
+
+from genome_store import genomes_to_arrays, arrays_to_genomes
+
+CHECKPOINT_VERSION = 1
+
+# read the next value of an itertools.count without losing it
+def _peek_counter(owner, name):
+    counter = getattr(owner, name)
+    if counter is None:
+        return None
+    value = next(counter)
+    setattr(owner, name, itertools.count(value))
+    return value
+
+def _restore_counter(owner, name, value):
+    setattr(owner, name, None if value is None else itertools.count(value))
+
+# Everything needed to continue a run exactly where it stopped: the genomes
+# of the next generation and of the best genome so far (in the compact genome
+# store layout), the species with their history, the genome, node and species
+# key counters, the state of the random module and the seed history of the
+# scenario schedule, if one is given (with the best genome of its current
+# stage for a curriculum). Written as one .npz file.
+def save_checkpoint(path, population, best_genome=None, generation=None, schedule=None):
+    if generation is None:
+        generation = population.generation
+    species_set = population.species
+    species = []
+    for sid, s in species_set.species.items():
+        species.append({
+            'key': sid,
+            'created': s.created,
+            'last_improved': s.last_improved,
+            'representative': s.representative.key,
+            'members': list(s.members),
+            'fitness': s.fitness,
+            'adjusted_fitness': s.adjusted_fitness,
+            'fitness_history': s.fitness_history,
+        })
+
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'generation': generation,
+        'species': species,
+        'genome_to_species': list(species_set.genome_to_species.items()),
+        'next_genome_key': _peek_counter(population.reproduction, 'genome_indexer'),
+        'next_species_key': _peek_counter(species_set, 'indexer'),
+        'next_node_key': _peek_counter(population.config.genome_config, 'node_indexer'),
+        'random_state': random.getstate(),
+        'has_best': best_genome is not None,
+        'schedule': schedule.state() if schedule is not None else None,
+    }
+
+    arrays = dict(('population_' + k, v) for k, v in genomes_to_arrays(population.population.values()).items())
+    if best_genome is not None:
+        arrays.update(('best_' + k, v) for k, v in genomes_to_arrays([best_genome]).items())
+    stage_best = getattr(schedule, 'best_genome', None)
+    if stage_best is not None:
+        arrays.update(('stage_best_' + k, v) for k, v in genomes_to_arrays([stage_best]).items())
+    arrays['state'] = np.array(json.dumps(state))
+
+    # write to a temporary file first so a crash never leaves a broken checkpoint
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+# rebuild a neat.Population (and its best genome) from a checkpoint file, and
+# hand the stored seed history to `schedule`
+def restore_checkpoint(path, config, schedule=None):
+    with np.load(path) as data:
+        state = json.loads(str(data['state']))
+        if state['version'] != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version {0} in {1}".format(state['version'], path))
+        genomes = arrays_to_genomes(dict((k[len('population_'):], data[k]) for k in data.files if k.startswith('population_')), config)
+        best_genome = None
+        if state['has_best']:
+            best_genome = arrays_to_genomes(dict((k[len('best_'):], data[k]) for k in data.files if k.startswith('best_')), config)[0]
+        stage_best = None
+        if any(k.startswith('stage_best_') for k in data.files):
+            stage_best = arrays_to_genomes(dict((k[len('stage_best_'):], data[k]) for k in data.files if k.startswith('stage_best_')), config)[0]
+
+    population = dict((g.key, g) for g in genomes)
+    p = neat.Population(config, (population, None, state['generation']))
+
+    species_set = config.species_set_type(config.species_set_config, p.reporters)
+    for s in state['species']:
+        species = neat.species.Species(s['key'], s['created'])
+        species.last_improved = s['last_improved']
+        species.update(population[s['representative']], dict((gid, population[gid]) for gid in s['members']))
+        species.fitness = s['fitness']
+        species.adjusted_fitness = s['adjusted_fitness']
+        species.fitness_history = s['fitness_history']
+        species_set.species[species.key] = species
+    species_set.genome_to_species = dict((gid, sid) for gid, sid in state['genome_to_species'])
+    p.species = species_set
+
+    _restore_counter(p.reproduction, 'genome_indexer', state['next_genome_key'])
+    _restore_counter(species_set, 'indexer', state['next_species_key'])
+    _restore_counter(config.genome_config, 'node_indexer', state['next_node_key'])
+    version, internal, gauss_next = state['random_state']
+    random.setstate((version, tuple(internal), gauss_next))
+    p.best_genome = best_genome
+    if schedule is not None and state.get('schedule') is not None:
+        schedule.restore(state['schedule'])
+        if stage_best is not None:
+            schedule.best_genome = stage_best
+    return p
+
+# Reporter that writes a checkpoint every `interval` generations, once the
+# next generation has been bred and speciated
+class TrainingCheckpointer(neat.reporting.BaseReporter):
+    def __init__(self, population, interval=50, directory='checkpoints', schedule=None):
+        self.population = population
+        self.schedule = schedule
+        self.interval = interval
+        self.directory = directory
+        self.best_genome = population.best_genome
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self.best_genome is None or best_genome.fitness > self.best_genome.fitness:
+            self.best_genome = best_genome
+
+    def end_generation(self, config, population, species_set):
+        # Population.generation is only incremented after the reporters ran
+        generation = self.population.generation + 1
+        if generation % self.interval == 0:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = os.path.join(self.directory, 'checkpoint-{0:06d}.npz'.format(generation))
+            save_checkpoint(path, self.population, self.best_genome, generation, self.schedule)
+            print("Saved checkpoint to", path)
+
+# most recent checkpoint file in a directory, or None
+def latest_checkpoint(directory):
+    if not os.path.isdir(directory):
+        return None
+    names = sorted(n for n in os.listdir(directory) if n.startswith('checkpoint-') and n.endswith('.npz'))
+    return os.path.join(directory, names[-1]) if names else None
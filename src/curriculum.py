@@ -0,0 +1,199 @@
+import argparse
+import copy
+import json
+import os
+import random
+import time
+import numpy as np
+import neat
+
+from evaluator import ScenarioSchedule, EpisodeLimits, make_scenarios, ROUND_LIMIT
+from batch_network import BatchNetwork
+from fitness_cache import FitnessCache
+from path_solver import random_queries, solve_paths
+
+# grid size and largest start to end distance (None for any) of every stage
+DEFAULT_STAGES = "6:3,8:5,12:8,12,20,30"
+
+# "rows[:distance],..." -> [(rows, distance or None), ...]
+def parse_stages(text):
+    stages = []
+    for stage in text.split(','):
+        rows, _, distance = stage.partition(':')
+        stages.append((int(rows), int(distance) if distance else None))
+    return stages
+
+# share of the routes from starts to ends that a genome solves on a num_rows
+# grid
+def success_rate(genome, config, starts, ends, num_rows):
+    net = BatchNetwork.create([genome], config)
+    _, success = solve_paths(net, starts, ends, num_rows)
+    return float(success.mean())
+
+# Scenario schedule that starts on small grids with nearby ends and moves to
+# the next stage once the best genome of a generation solves `advance` of
+# `queries` fixed routes drawn for the stage. Fitness grows with the grid and
+# the route lengths, so a success rate is the one measure every stage shares.
+# neat's own fitness_threshold is held back until the last stage, so only a
+# genome trained at full size ends the run (with finish=False none does), and
+# the best genome of the stage being played is kept as best_genome to be
+# saved as the winner. The stage is part of the seed handed to the fitness
+# cache, and the stage of every generation is saved with the seeds and kept
+# in training checkpoints.
+class Curriculum(ScenarioSchedule):
+    def __init__(self, stages, config, advance=0.9, rounds=ROUND_LIMIT, fixed_seed=None, episodes=1, finish=True, queries=200):
+        ScenarioSchedule.__init__(self, stages[0][0], rounds, fixed_seed, None, episodes)
+        self.stages = stages
+        self.config = config
+        self.advance = advance
+        self.finish = finish
+        self.queries = queries
+        self.target = config.fitness_threshold
+        self.stage = 0
+        self.advanced = False
+        self.played = []
+        self._enter(0)
+
+    def _enter(self, stage):
+        self.stage = stage
+        self.num_rows, self.max_distance = self.stages[stage]
+        last = stage == len(self.stages) - 1
+        self.config.fitness_threshold = self.target if last and self.finish else float('inf')
+        # the routes of a stage only depend on the stage, not on the run
+        routes = make_scenarios(self.num_rows, stage, self.queries, max_distance=self.max_distance)
+        self.starts, self.ends = routes[:, :2], routes[:, 2:]
+        self.best_genome = None
+
+    def start_generation(self, generation):
+        ScenarioSchedule.start_generation(self, generation)
+        # a stage is entered with the generation after the one that passed it
+        if self.advanced:
+            self.advanced = False
+            self._enter(self.stage + 1)
+            distance = "any distance" if self.max_distance is None else "up to {0} steps".format(self.max_distance)
+            print("Curriculum stage {0} of {1}: {2}x{2} grid, ends {3} from the start".format(
+                self.stage + 1, len(self.stages), self.num_rows, distance))
+
+    def post_evaluate(self, config, population, species, best_genome):
+        # elites are evaluated again next generation, so the best genome is
+        # kept as a copy with the fitness it had here
+        if self.best_genome is None or best_genome.fitness > self.best_genome.fitness:
+            self.best_genome = copy.deepcopy(best_genome)
+        if self.stage < len(self.stages) - 1:
+            rate = success_rate(best_genome, config, self.starts, self.ends, self.num_rows)
+            if rate >= self.advance:
+                print("Curriculum stage {0} passed: {1:.0%} of its routes solved".format(self.stage + 1, rate))
+                self.advanced = True
+
+    def next(self):
+        seed, scenarios = ScenarioSchedule.next(self)
+        self.played.append(self.stage)
+        return (self.stage, seed), scenarios
+
+    def scenarios(self, seed):
+        return make_scenarios(self.num_rows, seed, self.rounds, None, self.episodes if self.episodes > 1 else None, self.max_distance)
+
+    # the stage, and whether the next generation enters the next one, go into
+    # checkpoints with the seeds so a resumed run continues on the same stage
+    def state(self):
+        state = ScenarioSchedule.state(self)
+        state.update(stage=self.stage, advanced=self.advanced, played=list(self.played))
+        return state
+
+    def restore(self, state):
+        ScenarioSchedule.restore(self, state)
+        self._enter(state['stage'])
+        self.advanced = state['advanced']
+        self.played = list(state['played'])
+
+    def arrays(self):
+        arrays = ScenarioSchedule.arrays(self)
+        arrays['stages'] = np.array([(rows, -1 if distance is None else distance) for rows, distance in self.stages])
+        arrays['stage'] = np.array(self.played, dtype=np.int64)
+        return arrays
+
+# Reporter measuring the best genome of every generation on `queries` fixed
+# random routes of a num_rows grid, and ending the run once it solves at
+# least `rate` of them; generations and wall time until then are kept.
+class SuccessTracker(neat.reporting.BaseReporter):
+    def __init__(self, num_rows, rate=0.9, queries=200, seed=0):
+        self.num_rows = num_rows
+        self.rate = rate
+        self.starts, self.ends = random_queries(num_rows, queries, seed)
+        self.started = time.perf_counter()
+        self.generation = 0
+        self.rates = []
+        self.reached = None
+        self.seconds = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        rate = success_rate(best_genome, config, self.starts, self.ends, self.num_rows)
+        self.rates.append(rate)
+        if self.reached is None and rate >= self.rate:
+            self.reached = self.generation
+            self.seconds = time.perf_counter() - self.started
+            # neat ends the run after this evaluation
+            config.fitness_threshold = float('-inf')
+
+# Train until the best genome solves `rate` of the routes on the last stage's
+# grid, or for `generations` generations, and return the generation it got
+# there, the wall time and the success rate of every generation. Earlier
+# stages are passed at stage_rate.
+def time_to_target(config_path, stages, rate, generations, seed=None, queries=200, limits=None, episodes=1, stage_rate=0.9):
+    from nn_pathfinder_train import main
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+    if seed is not None:
+        random.seed(seed)
+    p = neat.Population(config)
+    schedule = Curriculum(stages, config, advance=stage_rate, episodes=episodes, finish=False, queries=queries)
+    tracker = SuccessTracker(stages[-1][0], rate, queries, seed)
+    p.add_reporter(schedule)
+    p.add_reporter(tracker)
+    cache = FitnessCache()
+    p.add_reporter(cache)
+    p.run(lambda genomes, config: main(genomes, config, cache=cache, schedule=schedule, limits=limits), generations)
+    return {
+        'stages': stages,
+        'generations_to_target': tracker.reached,
+        'seconds_to_target': tracker.seconds,
+        'generations_run': len(tracker.rates),
+        'seconds_run': time.perf_counter() - tracker.started,
+        'success_rates': tracker.rates,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare curriculum training with training at full size")
+    parser.add_argument("--stages", default=DEFAULT_STAGES, help="comma separated rows[:largest distance] of every stage; the last one is the full size")
+    parser.add_argument("--rate", type=float, default=0.9, help="share of random full size routes the best genome has to solve")
+    parser.add_argument("--stage-rate", type=float, default=0.9, help="share of a stage's routes the best genome has to solve to move on")
+    parser.add_argument("--queries", type=int, default=200, help="number of routes the success rates are measured on")
+    parser.add_argument("--generations", type=int, default=300, help="generations each run may take")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--episodes", type=int, default=1, help="independent round lists every genome plays per generation")
+    parser.add_argument("--output", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    local_dir = os.path.dirname(__file__) # gives path to current directory
+    config_path = os.path.join(local_dir, "neat-config.txt")
+    stages = parse_stages(args.stages)
+    limits = EpisodeLimits()
+    results = {}
+    for name, run_stages in (('curriculum', stages), ('direct', [(stages[-1][0], None)])):
+        print("Training", name)
+        results[name] = time_to_target(config_path, run_stages, args.rate, args.generations, seed=args.seed, queries=args.queries,
+                                       limits=limits, episodes=args.episodes, stage_rate=args.stage_rate)
+
+    for name, result in results.items():
+        if result['generations_to_target'] is None:
+            print("{0}: {1:.0%} of {2}x{2} routes not reached in {3} generations ({4:.1f} s), best {5:.1%}".format(
+                name, args.rate, stages[-1][0], result['generations_run'], result['seconds_run'], max(result['success_rates'])))
+        else:
+            print("{0}: {1:.0%} of {2}x{2} routes solved after {3} generations, {4:.1f} s".format(
+                name, args.rate, stages[-1][0], result['generations_to_target'] + 1, result['seconds_to_target']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Saved results to", args.output)
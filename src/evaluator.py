@@ -0,0 +1,360 @@
+import argparse
+import random
+import numpy as np
+import neat
+
+from pathfinder_env import make_grid, move, MOVE_DX, MOVE_DY
+from batch_network import BatchNetwork
+from sensor_table import get_sensor_table
+from fitness_cache import genome_hash
+from obstacle_map import ObstacleSensors, blocked_routes, map_hash
+from timing import StepTimer
+
+ROUND_LIMIT = 500
+
+# draw the start and end coordinates of every round up front, as a
+# (rounds, 4) array of (start_x, start_y, end_x, end_y), so every chunk of the
+# population (and every worker process) plays the same scenarios; on a
+# barrier map only playable rounds are kept, and with max_distance every end
+# lies at most that many steps from its start. With episodes, a
+# (episodes, rounds, 4) array of independent round lists is returned.
+def make_scenarios(num_rows, seed, rounds=ROUND_LIMIT, barriers=None, episodes=None, max_distance=None):
+    rng = np.random.default_rng(seed)
+    scenarios = rng.integers(0, num_rows, size=(rounds*(episodes or 1), 4))
+    same = (scenarios[:, :2] == scenarios[:, 2:]).all(axis=1)
+    while same.any():
+        scenarios[same, 2:] = rng.integers(0, num_rows, size=(same.sum(), 2))
+        same = (scenarios[:, :2] == scenarios[:, 2:]).all(axis=1)
+
+    if max_distance is not None:
+        if barriers is not None:
+            raise ValueError("A largest start to end distance is not supported on barrier maps")
+        far = np.abs(scenarios[:, 2:] - scenarios[:, :2]).sum(axis=1) > max_distance
+        while far.any():
+            scenarios[far, 2:] = scenarios[far, :2] + rng.integers(-max_distance, max_distance + 1, size=(far.sum(), 2))
+            ends = scenarios[:, 2:]
+            far = ((np.abs(ends - scenarios[:, :2]).sum(axis=1) > max_distance) | (ends < 0).any(axis=1) |
+                   (ends >= num_rows).any(axis=1) | (ends == scenarios[:, :2]).all(axis=1))
+
+    if barriers is not None:
+        if (~barriers).sum() < 2:
+            raise ValueError("A barrier map needs at least two free blocks")
+        blocked = blocked_routes(barriers, scenarios[:, :2], scenarios[:, 2:])
+        while blocked.any():
+            scenarios[blocked] = rng.integers(0, num_rows, size=(blocked.sum(), 4))
+            blocked = blocked_routes(barriers, scenarios[:, :2], scenarios[:, 2:])
+    if episodes is not None:
+        return scenarios.reshape(episodes, rounds, 4)
+    return scenarios
+
+# Reporter choosing the scenario set of every generation. By default each
+# generation draws a new seed from the random module (so --seed and resumed
+# checkpoints replay the same sets); with fixed_seed every generation plays
+# the same evaluation suite. The seed used by each generation is recorded and
+# written out with save(). With more than one episode every genome plays that
+# many independent round lists.
+class ScenarioSchedule(neat.reporting.BaseReporter):
+    def __init__(self, num_rows, rounds=ROUND_LIMIT, fixed_seed=None, barriers=None, episodes=1):
+        self.num_rows = num_rows
+        self.rounds = rounds
+        self.fixed_seed = fixed_seed
+        self.barriers = barriers
+        self.episodes = episodes
+        self.generation = 0
+        self.generations = []
+        self.seeds = []
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    # seed and scenario array of the generation being evaluated
+    def next(self):
+        seed = self.fixed_seed if self.fixed_seed is not None else random.getrandbits(32)
+        self.generations.append(self.generation)
+        self.seeds.append(seed)
+        return seed, self.scenarios(seed)
+
+    def scenarios(self, seed):
+        return make_scenarios(self.num_rows, seed, self.rounds, self.barriers, self.episodes if self.episodes > 1 else None)
+
+    def save(self, path):
+        np.savez_compressed(path, **self.arrays())
+
+    # seed history as plain lists, stored in training checkpoints so a
+    # resumed run keeps the seeds of the generations before it
+    def state(self):
+        return {'generations': list(self.generations), 'seeds': list(self.seeds)}
+
+    def restore(self, state):
+        self.generations = list(state['generations'])
+        self.seeds = list(state['seeds'])
+
+    def arrays(self):
+        arrays = {
+            'num_rows': np.array(self.num_rows),
+            'rounds': np.array(self.rounds),
+            'episodes': np.array(self.episodes),
+            'generations': np.array(self.generations, dtype=np.int64),
+            'seeds': np.array(self.seeds, dtype=np.int64),
+        }
+        if self.barriers is not None:
+            arrays['barriers'] = self.barriers
+        if self.fixed_seed is not None:
+            arrays['suite'] = self.scenarios(self.fixed_seed)
+        return arrays
+
+# Cuts agents that are clearly not heading for the end of a round: once the
+# round took budget_factor times the shortest route length (plus
+# budget_slack) steps, or once an agent went stall_steps steps without
+# getting closer to the end than it had been. A cut agent fails like a crash
+# does. Either check is off when its setting is None.
+class EpisodeLimits:
+    def __init__(self, budget_factor=3.0, budget_slack=2, stall_steps=12):
+        self.budget_factor = budget_factor
+        self.budget_slack = budget_slack
+        self.stall_steps = stall_steps
+
+    # step budget of a round, for one shortest route length or an array
+    def budget(self, shortest):
+        if self.budget_factor is None:
+            return None
+        return (self.budget_factor*np.asarray(shortest)).astype(np.int64) + self.budget_slack
+
+    # the settings, as part of the fitness cache key
+    def key(self):
+        return (self.budget_factor, self.budget_slack, self.stall_steps)
+
+# combine the (genomes, episodes) fitness of every episode into one fitness
+# per genome: their mean, or the given quantile (0 is the worst episode)
+def aggregate_fitness(fitness, aggregate='mean'):
+    if aggregate == 'mean':
+        return fitness.mean(axis=1)
+    return np.quantile(fitness, float(aggregate), axis=1)
+
+# argparse type of --fitness-aggregate: "mean" or a quantile in [0, 1]
+def parse_aggregate(text):
+    if text == 'mean':
+        return text
+    try:
+        quantile = float(text)
+    except ValueError:
+        quantile = None
+    if quantile is None or not 0 <= quantile <= 1:
+        raise argparse.ArgumentTypeError("expected mean or a quantile between 0 and 1, got {0!r}".format(text))
+    return quantile
+
+# round values are scalars when every agent plays the same round and per-agent
+# arrays otherwise
+def _pick(values, index):
+    return values if np.ndim(values) == 0 else values[index]
+
+# passes the fitness loop's calls on to several observers, e.g. the window,
+# a frame recorder and a grid publisher
+class Observers:
+    def __init__(self, *observers):
+        self.observers = observers
+
+    def on_round(self, grid, level, fitness=None):
+        for observer in self.observers:
+            observer.on_round(grid, level, fitness)
+
+    def on_step(self, grid, level):
+        for observer in self.observers:
+            observer.on_step(grid, level)
+
+# Play every round of the scenario list for a group of genomes and return
+# their fitness; genomes never interact, so any split of the population into
+# groups gives the same fitness per genome.
+#
+# A (episodes, rounds, 4) scenario array plays several independent episodes
+# per genome side by side: agent a is episode a % episodes of genome
+# a // episodes, so the flat state arrays below are (genomes, episodes)
+# arrays in C order. A crash only ends its own episode, and the episode
+# fitnesses are combined with aggregate_fitness.
+def simulate(genomes, config, scenarios, num_rows, renderer=None, barriers=None, limits=None, timer=None, aggregate='mean'):
+    scenarios = np.asarray(scenarios)
+    if scenarios.ndim == 2:
+        scenarios = scenarios[None]
+    episodes, rounds, _ = scenarios.shape
+    pop_size = len(genomes)*episodes
+    # a watched run keeps the cells the renderer draws
+    grid = make_grid(num_rows, pop_size, False if renderer is not None else None, barriers)
+    agents = grid.all_agents
+    episode_of = agents % episodes
+    cur_xs = np.zeros(pop_size, dtype=np.int64)
+    cur_ys = np.zeros(pop_size, dtype=np.int64)
+    fitness = np.zeros(pop_size)
+    valid_list = np.ones(pop_size, dtype=bool)
+    level_counter = 0
+    closest = np.zeros(pop_size)
+    stalled = np.zeros(pop_size, dtype=np.int64)
+    budgets = np.zeros(pop_size, dtype=np.int64)
+
+    # compile the whole group into one batched network
+    net = BatchNetwork.create(genomes, config)
+    # barrier maps sense and reward the BFS distance instead of the straight line
+    sensors = get_sensor_table(num_rows) if barriers is None else ObstacleSensors(barriers)
+
+    for loop_counter in range(1, rounds + 1):
+        if not valid_list.any():
+            break
+
+        # reward model for surviving longer rounds
+        if loop_counter < rounds:
+            level_counter += 1
+            fitness[valid_list] += 5
+
+        # with one episode every agent heads for the same end block, else
+        # each agent gets the start and end of its own episode's round
+        start_x, start_y, end_x, end_y = scenarios[:, loop_counter - 1].T
+        if episodes == 1:
+            start_x, start_y, end_x, end_y = int(start_x[0]), int(start_y[0]), int(end_x[0]), int(end_y[0])
+        else:
+            start_x, start_y, end_x, end_y = start_x[episode_of], start_y[episode_of], end_x[episode_of], end_y[episode_of]
+
+        # reset grid parameters if it is still valid
+        resetting = agents[valid_list]
+        grid.reset(_pick(start_x, resetting), _pick(start_y, resetting), _pick(end_x, resetting), _pick(end_y, resetting), resetting)
+        cur_xs[resetting] = _pick(start_x, resetting)
+        cur_ys[resetting] = _pick(start_y, resetting)
+        iter_loop_finished = ~valid_list
+
+        if timer is not None:
+            timer.alive.append(int(valid_list.sum()))
+            timer.start()
+        if renderer is not None:
+            renderer.on_round(grid, level_counter, fitness)
+            if timer is not None:
+                timer.lap('render')
+
+        if limits is not None:
+            shortest = sensors.route_length(start_x, start_y, end_x, end_y)
+            closest[resetting] = _pick(shortest, resetting)
+            stalled[valid_list] = 0
+            budget = limits.budget(shortest)
+            if budget is not None:
+                budgets[:] = budget
+            step_counter = 0
+
+        while not iter_loop_finished.all():
+            if timer is not None:
+                timer.start()
+            live = agents[~iter_loop_finished]
+            xs = cur_xs[live]
+            ys = cur_ys[live]
+            live_end_x = _pick(end_x, live)
+            live_end_y = _pick(end_y, live)
+
+            # punish model for very long paths
+            fitness[live] -= 0.2
+
+            # find the argmax of the four directions (the smallest output wins)
+            directions = np.argmin(net.activate(sensors.inputs(xs, ys, live_end_x, live_end_y), live // episodes), axis=1)
+            if timer is not None:
+                timer.lap('inference')
+            dxs = MOVE_DX[directions]
+            dys = MOVE_DY[directions]
+
+            xs, ys, valid = move(xs, ys, dxs, dys, grid, live)
+            cur_xs[live] = xs
+            cur_ys[live] = ys
+
+            # reward for moving closer to end
+            fitness[live] += sensors.rewards(xs, ys, live_end_x, live_end_y, directions)
+
+            # reduce fitness score if path crashes
+            crashed = live[~valid]
+            fitness[crashed] = -1
+            valid_list[crashed] = False
+            iter_loop_finished[crashed] = True
+
+            # increase fitness if end target reached
+            reached = valid & (xs == live_end_x) & (ys == live_end_y)
+            step_boost = 10
+            fitness[live[reached]] += step_boost
+            iter_loop_finished[live[reached]] = True
+
+            # cut agents over the step budget or not getting any closer
+            if limits is not None:
+                step_counter += 1
+                going = valid & ~reached
+                walkers = live[going]
+                cut = np.zeros(len(walkers), dtype=bool)
+                if budget is not None:
+                    cut |= step_counter >= budgets[walkers]
+                if limits.stall_steps is not None:
+                    distance = sensors.route_length(xs[going], ys[going], _pick(live_end_x, going), _pick(live_end_y, going))
+                    closer = distance < closest[walkers]
+                    closest[walkers] = np.minimum(closest[walkers], distance)
+                    stalled[walkers] = np.where(closer, 0, stalled[walkers] + 1)
+                    cut |= stalled[walkers] >= limits.stall_steps
+                cut = walkers[cut]
+                fitness[cut] = -1
+                valid_list[cut] = False
+                iter_loop_finished[cut] = True
+
+            if timer is not None:
+                timer.lap('environment')
+                timer.steps += 1
+                timer.agent_steps += len(live)
+            if renderer is not None:
+                renderer.on_step(grid, level_counter)
+                if timer is not None:
+                    timer.lap('render')
+
+    if episodes == 1:
+        return fitness
+    return aggregate_fitness(fitness.reshape(len(genomes), episodes), aggregate)
+
+# entry point of the worker processes, job is
+# (genomes, config, scenarios, num_rows, barriers, limits, timed, aggregate);
+# returns the fitness and the worker's StepTimer (None when not timed)
+def evaluate_chunk(job):
+    genomes, config, scenarios, num_rows, barriers, limits, timed, aggregate = job
+    timer = StepTimer() if timed else None
+    return simulate(genomes, config, scenarios, num_rows, barriers=barriers, limits=limits, timer=timer, aggregate=aggregate), timer
+
+# assign a fitness to every genome, splitting the population into one chunk
+# per worker when a process pool is given
+def evaluate_genomes(genomes, config, scenarios, num_rows, pool=None, workers=1, renderer=None, cache=None, scenario_seed=None, barriers=None, limits=None, timer=None, aggregate='mean'):
+    # genomes already played on this scenario set (and copies of each other)
+    # are simulated only once
+    if cache is not None:
+        episodes = len(scenarios) if np.ndim(scenarios) == 3 else 1
+        scenario_key = (scenario_seed, None if barriers is None else map_hash(barriers), None if limits is None else limits.key(), episodes, aggregate)
+        keys = [(genome_hash(g), scenario_key) for g in genomes]
+        known = {}
+        pending = {}
+        for g, key in zip(genomes, keys):
+            if key not in known and key not in pending:
+                fitness = cache.get(key)
+                if fitness is None:
+                    pending[key] = g
+                else:
+                    known[key] = fitness
+        fitness = _evaluate(list(pending.values()), config, scenarios, num_rows, pool=pool, workers=workers, renderer=renderer,
+                            barriers=barriers, limits=limits, timer=timer, aggregate=aggregate)
+        for key, f in zip(pending, fitness):
+            known[key] = float(f)
+            cache.put(key, float(f))
+        fitness = np.array([known[key] for key in keys])
+    else:
+        fitness = _evaluate(genomes, config, scenarios, num_rows, pool=pool, workers=workers, renderer=renderer,
+                            barriers=barriers, limits=limits, timer=timer, aggregate=aggregate)
+
+    for g, f in zip(genomes, fitness):
+        g.fitness = float(f)
+    return fitness
+
+def _evaluate(genomes, config, scenarios, num_rows, pool=None, workers=1, renderer=None, barriers=None, limits=None, timer=None, aggregate='mean'):
+    if not genomes:
+        return np.zeros(0)
+    if pool is None or workers <= 1:
+        return simulate(genomes, config, scenarios, num_rows, renderer=renderer, barriers=barriers, limits=limits, timer=timer, aggregate=aggregate)
+    bounds = np.linspace(0, len(genomes), workers + 1).astype(int)
+    jobs = [(genomes[a:b], config, scenarios, num_rows, barriers, limits, timer is not None, aggregate) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    results = pool.map(evaluate_chunk, jobs)
+    if timer is not None:
+        for _, chunk_timer in results:
+            timer.merge(chunk_timer)
+    return np.concatenate([fitness for fitness, _ in results])
@@ -0,0 +1,48 @@
+import hashlib
+from collections import OrderedDict
+import neat
+
+# Structural hash of everything that decides how a genome plays: its nodes
+# (bias, response, activation, aggregation) and its enabled connections
+# (weight), in key order. Genome keys and fitness do not take part, so an
+# elite carried into the next generation hashes the same as before.
+def genome_hash(genome):
+    nodes = sorted((k, n.bias, n.response, n.activation, n.aggregation) for k, n in genome.nodes.items())
+    connections = sorted((k, c.weight) for k, c in genome.connections.items() if c.enabled)
+    return hashlib.sha1(repr((nodes, connections)).encode()).hexdigest()
+
+# Bounded map from (genome hash, scenario seed) to fitness, evicting the
+# least recently used entry when full. It is also a reporter, printing and
+# resetting its hit/miss counters after every generation's evaluation.
+class FitnessCache(neat.reporting.BaseReporter):
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.total_hits = 0
+        self.total_misses = 0
+
+    def get(self, key):
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def put(self, key, fitness):
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def post_evaluate(self, config, population, species, best_genome):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        print("Fitness cache: {0} hits, {1} misses ({2:.1%} hit rate), {3} entries".format(self.hits, self.misses, rate, len(self.entries)))
+        self.total_hits += self.hits
+        self.total_misses += self.misses
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,114 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+import neat
+
+from pathfinder_env import STATE_COLORS, GREY, BLUE
+
+PALETTE = np.array(STATE_COLORS, dtype=np.uint8)
+
+# minimal RGB PNG writer, so frames can be written without pygame
+def write_png(path, rgb):
+    height, width, _ = rgb.shape
+    rows = np.zeros((height, 1 + width*3), dtype=np.uint8)
+    rows[:, 1:] = rgb.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+# Turn a (tiles, rows, cols) snapshot of cell states into an RGB image laid
+# out like the training window: tile g at column g % side and row g // side,
+# block_px pixels per block, grey lines between blocks and blue ones between
+# grids.
+def rasterize(cells, side, block_px=8):
+    tiles, num_rows, num_cols = cells.shape
+    padded = np.zeros((side*side, num_rows, num_cols), dtype=np.uint8)
+    padded[:tiles] = cells
+    # [tile row, tile col, x, y] -> image [y, x]
+    comb = padded.reshape(side, side, num_rows, num_cols).transpose(0, 3, 1, 2).reshape(side*num_cols, side*num_rows)
+    image = PALETTE[comb].repeat(block_px, axis=0).repeat(block_px, axis=1)
+    # horizontal lines first, as the window draws them
+    image[::block_px, :] = GREY
+    image[::block_px*num_cols, :] = BLUE
+    image[:, ::block_px] = GREY
+    image[:, ::block_px*num_rows] = BLUE
+    return image
+
+# Records the training grids to a directory of PNG frames. It has the
+# renderer interface of the fitness loop, but on_round/on_step only copy the
+# cells of the best max_tiles genomes every `every` calls, during generations
+# that are a multiple of generation_interval. The copies go through a
+# bounded queue to a background thread that rasterizes and writes them; when
+# the queue is full the frame is dropped, so training never waits on it.
+# As a reporter it follows the generation number.
+class FrameRecorder(neat.reporting.BaseReporter):
+    def __init__(self, directory, every=5, generation_interval=1, max_tiles=25, block_px=8, queue_size=64):
+        self.directory = directory
+        self.every = every
+        self.generation_interval = generation_interval
+        self.side = int(np.sqrt(max_tiles))
+        self.block_px = block_px
+        self.frames = queue.Queue(queue_size)
+        self.generation = 0
+        self.recording = False
+        self.calls = 0
+        self.agents = None
+        self.written = 0
+        self.dropped = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.thread = threading.Thread(target=self._write_frames, daemon=True)
+        self.thread.start()
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.recording = generation % self.generation_interval == 0
+        self.calls = 0
+
+    def _snapshot(self, grid, level):
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return
+        name = 'gen{0:05d}-frame{1:06d}-level{2:03d}.png'.format(self.generation, self.calls - 1, level)
+        try:
+            self.frames.put_nowait((name, grid.cells[self.agents]))
+        except queue.Full:
+            self.dropped += 1
+
+    def on_round(self, grid, level, fitness=None):
+        if not self.recording:
+            return
+        count = min(self.side*self.side, grid.pop_size)
+        if fitness is None:
+            self.agents = np.arange(count)
+        else:
+            self.agents = np.argsort(-fitness, kind='stable')[:count]
+        self._snapshot(grid, level)
+
+    def on_step(self, grid, level):
+        if self.recording:
+            self._snapshot(grid, level)
+
+    def _write_frames(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            name, cells = frame
+            write_png(os.path.join(self.directory, name), rasterize(cells, self.side, self.block_px))
+            self.written += 1
+
+    # write the frames still queued and stop the writer thread
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        print("Recorded {0} frames to {1} ({2} dropped)".format(self.written, self.directory, self.dropped))
@@ -0,0 +1,117 @@
+import gc
+from collections import deque
+from itertools import repeat
+import numpy as np
+from neat.attributes import BoolAttribute, StringAttribute
+
+# version of the array layout written by genomes_to_arrays
+STORE_VERSION = 1
+
+# one column per gene attribute: floats and bools are stored as they are,
+# strings (activation, aggregation, ...) as indices into a table of names
+def _attribute_columns(genes, attributes, prefix, arrays):
+    for a in attributes:
+        values = [getattr(gene, a.name) for gene in genes]
+        column = '{0}_{1}'.format(prefix, a.name)
+        if isinstance(a, StringAttribute):
+            names = sorted(set(values))
+            index = dict((name, i) for i, name in enumerate(names))
+            arrays[column] = np.array([index[v] for v in values], dtype=np.int32)
+            arrays[column + '_names'] = np.array(names, dtype=str)
+        elif isinstance(a, BoolAttribute):
+            arrays[column] = np.array(values, dtype=bool)
+        else:
+            arrays[column] = np.array(values, dtype=np.float64)
+
+def _attribute_values(arrays, attributes, prefix):
+    columns = []
+    for a in attributes:
+        column = '{0}_{1}'.format(prefix, a.name)
+        if isinstance(a, StringAttribute):
+            names = arrays[column + '_names'].tolist()
+            columns.append([names[i] for i in arrays[column].tolist()])
+        else:
+            columns.append(arrays[column].tolist())
+    return columns
+
+# Genes built straight from their attribute columns. Running every gene's
+# __init__ and then updating its attributes costs more than unpickling does,
+# so bare instances are given their finished __dict__, with the loops left
+# to map() and zip().
+def _make_genes(gene_type, keys, attributes, columns):
+    fields = ['key'] + [a.name for a in attributes]
+    dicts = map(dict, map(zip, repeat(fields), zip(keys, *columns)))
+    genes = list(map(object.__new__, repeat(gene_type, len(keys))))
+    deque(map(setattr, genes, repeat('__dict__'), dicts), maxlen=0)
+    return genes
+
+# Flatten genomes into a few contiguous arrays. Nodes and connections of
+# every genome are stored back to back, in dict order, with offset arrays
+# marking where each genome starts; a missing fitness is stored as NaN.
+def genomes_to_arrays(genomes):
+    genomes = list(genomes)
+    nodes = [gene for g in genomes for gene in g.nodes.values()]
+    connections = [gene for g in genomes for gene in g.connections.values()]
+
+    arrays = {
+        'store_version': np.array(STORE_VERSION),
+        'keys': np.array([g.key for g in genomes], dtype=np.int64),
+        'fitness': np.array([np.nan if g.fitness is None else g.fitness for g in genomes], dtype=np.float64),
+        'node_offsets': np.cumsum([0] + [len(g.nodes) for g in genomes]),
+        'conn_offsets': np.cumsum([0] + [len(g.connections) for g in genomes]),
+        'node_keys': np.array([gene.key for gene in nodes], dtype=np.int64),
+        'conn_keys': np.array([gene.key for gene in connections], dtype=np.int64).reshape(-1, 2),
+    }
+    if nodes:
+        _attribute_columns(nodes, type(nodes[0])._gene_attributes, 'node', arrays)
+    if connections:
+        _attribute_columns(connections, type(connections[0])._gene_attributes, 'conn', arrays)
+    return arrays
+
+def arrays_to_genomes(arrays, config):
+    version = int(arrays['store_version'])
+    if version != STORE_VERSION:
+        raise ValueError("Unsupported genome store version {0}".format(version))
+
+    genome_config = config.genome_config
+    node_type = genome_config.node_gene_type
+    conn_type = genome_config.connection_gene_type
+    node_keys = arrays['node_keys'].tolist()
+    conn_keys = list(zip(arrays['conn_keys'][:, 0].tolist(), arrays['conn_keys'][:, 1].tolist()))
+    node_columns = _attribute_values(arrays, node_type._gene_attributes, 'node') if node_keys else []
+    conn_columns = _attribute_values(arrays, conn_type._gene_attributes, 'conn') if conn_keys else []
+    node_offsets = arrays['node_offsets'].tolist()
+    conn_offsets = arrays['conn_offsets'].tolist()
+
+    # the cyclic garbage collector would otherwise walk the growing heap again
+    # and again while hundreds of thousands of genes are allocated
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        nodes = _make_genes(node_type, node_keys, node_type._gene_attributes, node_columns)
+        connections = _make_genes(conn_type, conn_keys, conn_type._gene_attributes, conn_columns)
+
+        genomes = []
+        for i, (key, fitness) in enumerate(zip(arrays['keys'].tolist(), arrays['fitness'].tolist())):
+            g = config.genome_type(key)
+            g.fitness = None if fitness != fitness else fitness
+            a, b = node_offsets[i], node_offsets[i + 1]
+            g.nodes = dict(zip(node_keys[a:b], nodes[a:b]))
+            a, b = conn_offsets[i], conn_offsets[i + 1]
+            g.connections = dict(zip(conn_keys[a:b], connections[a:b]))
+            genomes.append(g)
+    finally:
+        if collecting:
+            gc.enable()
+    return genomes
+
+# compact, versioned alternative to pickling a list of genomes
+def save_genomes(path, genomes):
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, **genomes_to_arrays(genomes))
+
+def load_genomes(path, config):
+    # every item of an NpzFile is read and decompressed again when accessed
+    with np.load(path) as data:
+        arrays = dict((k, data[k]) for k in data.files)
+    return arrays_to_genomes(arrays, config)
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import pickle
+import queue
+import random
+import traceback
+import multiprocessing
+from itertools import count
+import neat
+
+from nn_pathfinder_train import main
+from evaluator import ScenarioSchedule, EpisodeLimits, parse_aggregate
+from batch_network import BatchNetwork
+from fitness_cache import FitnessCache
+from obstacle_map import load_map, random_map
+
+# raised inside an island to end its run once another island found a winner
+class IslandStopped(Exception):
+    pass
+
+# Reporter connecting one island to the others. After every evaluation it
+# sends a summary of the generation to the parent; every `interval`
+# generations it also sends copies of its best `migrants` genomes to the next
+# island of the ring, and once the next generation is bred it puts the
+# genomes it received from the previous island in place of as many fresh
+# offspring (or weak elites). A migrant takes over the key and species of the
+# genome it replaces until the next speciation, and is evaluated like any
+# other genome.
+class Migration(neat.reporting.BaseReporter):
+    def __init__(self, island, inbox, outbox, results, stop, interval=10, migrants=2, timeout=60.0):
+        self.island = island
+        self.inbox = inbox
+        self.outbox = outbox
+        self.results = results
+        self.stop = stop
+        self.interval = interval
+        self.migrants = migrants
+        self.timeout = timeout
+        self.generation = 0
+        self.received = 0
+
+    def _migrating(self):
+        return self.interval > 0 and (self.generation + 1) % self.interval == 0
+
+    def start_generation(self, generation):
+        if self.stop.is_set():
+            raise IslandStopped()
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        fitnesses = [g.fitness for g in population.values()]
+        self.results.put(('generation', self.island, {
+            'island': self.island,
+            'generation': self.generation,
+            'best': best_genome.fitness,
+            'mean': sum(fitnesses) / len(fitnesses),
+            'species': len(species.species),
+            'migrants_received': self.received,
+        }))
+        if self._migrating():
+            best = sorted(population.values(), key=lambda g: g.fitness, reverse=True)[:self.migrants]
+            self.outbox.put(pickle.dumps(best))
+
+    def found_solution(self, config, generation, best):
+        self.stop.set()
+
+    def end_generation(self, config, population, species_set):
+        if not self._migrating():
+            return
+        # wait for the previous island to reach the same generation, but not
+        # for one that has stopped
+        data = None
+        waited = 0.0
+        while data is None and waited < self.timeout and not self.stop.is_set():
+            try:
+                data = self.inbox.get(timeout=1.0)
+            except queue.Empty:
+                waited += 1.0
+        if data is None:
+            return
+
+        # fresh offspring are replaced first (they have no fitness yet), then
+        # the weakest elites
+        keys = sorted(population, key=lambda k: (population[k].fitness is not None, population[k].fitness or 0.0))
+        for key, genome in zip(keys, pickle.loads(data)):
+            genome.key = key
+            genome.fitness = None
+            population[key] = genome
+            species_set.species[species_set.genome_to_species[key]].members[key] = genome
+            self.received += 1
+
+        # new hidden nodes must not reuse the ids of the migrants' nodes
+        genome_config = config.genome_config
+        highest = max(max(g.nodes) for g in population.values())
+        start = highest + 1 if genome_config.node_indexer is None else max(next(genome_config.node_indexer), highest + 1)
+        genome_config.node_indexer = count(start)
+
+# entry point of an island process: a complete headless training run on its
+# own population, scenario seeds and fitness cache
+def run_island(island, config_path, inbox, outbox, results, stop, generations, seed, interval, migrants,
+               num_rows=12, barriers=None, limits=None, episodes=1, aggregate='mean', cache_size=10000):
+    best = None
+    try:
+        if seed is not None:
+            random.seed(seed + island)
+        config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+        p = neat.Population(config)
+        p.add_reporter(Migration(island, inbox, outbox, results, stop, interval, migrants))
+        schedule = ScenarioSchedule(num_rows, barriers=barriers, episodes=episodes)
+        p.add_reporter(schedule)
+        cache = None
+        if cache_size > 0:
+            cache = FitnessCache(cache_size)
+            p.add_reporter(cache)
+        try:
+            p.run(lambda genomes, config: main(genomes, config, cache=cache, schedule=schedule, limits=limits, aggregate=aggregate), generations)
+        except IslandStopped:
+            pass
+        best = p.best_genome
+    except Exception:
+        results.put(('error', island, traceback.format_exc()))
+    finally:
+        # a migrant the next island never picked up must not keep this one alive
+        outbox.cancel_join_thread()
+        results.put(('done', island, pickle.dumps(best)))
+
+# Island model: `islands` populations evolve in their own processes and pass
+# their best genomes around a ring every `interval` generations. The parent
+# prints one combined line per island generation (and writes them to
+# stats_path as JSON lines), stops every island once one of them reaches the
+# fitness threshold, and saves the best genome of all islands as the winner.
+def run_islands(config_path, islands=4, generations=10000, interval=10, migrants=2, seed=None,
+                num_rows=12, barriers=None, limits=None, episodes=1, aggregate='mean', cache_size=10000, stats_path=None):
+    inboxes = [multiprocessing.Queue() for _ in range(islands)]
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    processes = []
+    for i in range(islands):
+        process = multiprocessing.Process(target=run_island, args=(
+            i, config_path, inboxes[i], inboxes[(i + 1) % islands], results, stop, generations, seed, interval, migrants), kwargs={
+            'num_rows': num_rows, 'barriers': barriers, 'limits': limits, 'episodes': episodes, 'aggregate': aggregate, 'cache_size': cache_size})
+        process.start()
+        processes.append(process)
+
+    stats = open(stats_path, 'w') if stats_path is not None else None
+    winners = []
+    running = islands
+    try:
+        while running:
+            kind, island, data = results.get()
+            if kind == 'generation':
+                print("Island {0} generation {1}: best {2:.3f}, mean {3:.3f}, {4} species, {5} migrants received".format(
+                    island, data['generation'], data['best'], data['mean'], data['species'], data['migrants_received']))
+                if stats is not None:
+                    stats.write(json.dumps(data) + '\n')
+                    stats.flush()
+            elif kind == 'error':
+                print("Island", island, "failed:\n" + data)
+            else:
+                running -= 1
+                genome = pickle.loads(data)
+                if genome is not None:
+                    winners.append((genome.fitness, island, genome))
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+        if stats is not None:
+            stats.close()
+
+    if not winners:
+        raise RuntimeError("No island finished its run")
+    fitness, island, winner = max(winners, key=lambda w: w[0])
+    print("Best genome from island {0} with fitness {1:.3f}".format(island, fitness))
+    pickle.dump(winner, open('winner.pkl', 'wb'))
+
+    # compiled copy of the winner for fast, neat-free inference
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+    BatchNetwork.create([winner], config).save('winner.npz')
+    return winner
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the NEAT pathfinder on several island populations")
+    parser.add_argument("--islands", type=int, default=4, help="number of populations, each evolved in its own process")
+    parser.add_argument("--migration-interval", type=int, default=10, help="generations between migrations (0 disables them)")
+    parser.add_argument("--migrants", type=int, default=2, help="best genomes sent to the next island on every migration")
+    parser.add_argument("--generations", type=int, default=10000, help="maximum number of generations per island")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the first island, the others use the following seeds")
+    parser.add_argument("--rows", type=int, default=12, help="grid size of the training rounds")
+    parser.add_argument("--map", help="barrier map (.npy) every round is played on; its size overrides --rows")
+    parser.add_argument("--obstacles", type=float, default=0.0, help="share of blocks turned into barriers on a random map (seeded by --seed)")
+    parser.add_argument("--step-budget", type=float, default=3.0, help="steps allowed per round as a multiple of the shortest route (0 disables the budget)")
+    parser.add_argument("--stall-steps", type=int, default=12, help="steps an agent may take without getting closer to the end (0 disables the check)")
+    parser.add_argument("--episodes", type=int, default=1, help="independent round lists every genome plays per generation")
+    parser.add_argument("--fitness-aggregate", type=parse_aggregate, default="mean", help="how the episode fitnesses are combined: mean, or a quantile such as 0.25")
+    parser.add_argument("--fitness-cache", type=int, default=10000, help="number of genome fitnesses remembered per island (0 disables the cache)")
+    parser.add_argument("--stats", help="write the per-generation summary of every island to this .jsonl file")
+    args = parser.parse_args()
+
+    local_dir = os.path.dirname(__file__) # gives path to current directory
+    config_path = os.path.join(local_dir, "neat-config.txt")
+    barriers = None
+    if args.map:
+        barriers = load_map(args.map)
+        args.rows = len(barriers)
+    elif args.obstacles > 0:
+        barriers = random_map(args.rows, args.obstacles, args.seed)
+    limits = EpisodeLimits(args.step_budget or None, 2, args.stall_steps or None)
+    run_islands(config_path, islands=args.islands, generations=args.generations, interval=args.migration_interval,
+                migrants=args.migrants, seed=args.seed, num_rows=args.rows, barriers=barriers, limits=limits,
+                episodes=args.episodes, aggregate=args.fitness_aggregate, cache_size=args.fitness_cache, stats_path=args.stats)
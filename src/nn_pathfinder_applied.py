@@ -1,10 +1,12 @@
-import pygame
-import math
+import asyncio
+import functools
 import numpy as np
-import pickle
-import neat
 import os
 
+from sensor_table import get_sensor_table
+from pathfinder_env import SparseGrid, move, MOVE_DX, MOVE_DY
+from path_solver import load_model
+
 # Initialize global variables
 WIDTH = 900
 DARK_BLUE = (58, 145, 181)
@@ -15,11 +17,20 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 LIGHT_GREEN = (96, 224, 147)
 GREY = (128, 128, 128)
-WIN = pygame.display.set_mode((WIDTH, WIDTH))
-pygame.display.set_caption("Pathfinding NEAT Genetic Algorithm")
+
+# pygame and the window are only set up when the app is run, so the solver
+# can be imported by scripts, tests and worker processes without a display
+def open_window(width, caption):
+    import pygame
+    pygame.init()
+    win = pygame.display.set_mode((width, width))
+    pygame.display.set_caption(caption)
+    return win
 
 # Define class for each colored block
 class Block:
+    font = None
+
     def __init__(self, row, col, width):
         self.row = row
         self.col = col
@@ -31,7 +42,6 @@ class Block:
         
         # initialize all blocks to white
         self.color = WHITE
-        self.font = pygame.font.Font('freesansbold.ttf', 10)
         self.score = ''
         
     def set_score(self, score):
@@ -78,10 +88,15 @@ class Block:
         
     # draw the cube
     def draw(self, win):
+        import pygame
         pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.width))
-        text_surface = self.font.render(self.score, True, WHITE, None)
-        text_rect = (self.x + 0.4*(self.width), self.y + 0.4*(self.width))
-        win.blit(text_surface, text_rect)
+        # one font for every block, loaded the first time a score is shown
+        if self.score:
+            if Block.font is None:
+                Block.font = pygame.font.Font('freesansbold.ttf', 10)
+            text_surface = Block.font.render(self.score, True, WHITE, None)
+            text_rect = (self.x + 0.4*(self.width), self.y + 0.4*(self.width))
+            win.blit(text_surface, text_rect)
 
 # initialize the grid  
 def make_grid(num_rows, width):
@@ -96,6 +111,7 @@ def make_grid(num_rows, width):
     return grid
 
 def draw_grid(win, num_rows, width):
+    import pygame
     gap = width // num_rows
     for i in range(num_rows):
         # draw a horizontal line to separate every row
@@ -107,6 +123,7 @@ def draw_grid(win, num_rows, width):
 
 # draw the grids and each spots
 def draw(win, grid, num_rows, width):
+    import pygame
     win.fill(WHITE)
     
     for row in grid:
@@ -124,10 +141,6 @@ def get_clicked_pos(pos, num_rows, width):
     col = x // gap
     return row, col
 
-# distance calculator
-def dist(cur_x, cur_y, end_x, end_y):
-    return math.sqrt((cur_x-end_x)**2 + (cur_y-end_y)**2)
-
 def moveRight(cur_x, cur_y, grid):
     grid_width = len(grid[0])
     
@@ -169,23 +182,31 @@ def moveUp(cur_x, cur_y, grid):
     return cur_x, cur_y, False
 
 
-def solveNN(draw, grid, start, end, num_rows, genomes, config):
-    cur_y, cur_x = start.get_pos()
-    end_y, end_x = end.get_pos()
-    
-    for _, g in genomes:
-        net = neat.nn.FeedForwardNetwork.create(g, config)
+# grid is either the drawn grid of Blocks, with start and end Blocks, or a
+# SparseGrid of one agent with (x, y) start and end tuples, for grids far too
+# large to draw; draw can be None to solve without a window
+def solveNN(draw, grid, start, end, num_rows, net):
+    sparse = isinstance(grid, SparseGrid)
+    if sparse:
+        cur_x, cur_y = start
+        end_x, end_y = end
+        grid.reset(cur_x, cur_y, end_x, end_y)
+    else:
+        cur_y, cur_x = start.get_pos()
+        end_y, end_x = end.get_pos()
+    sensors = get_sensor_table(num_rows)
         
-    clock = pygame.time.Clock()
+    clock = None
+    if draw is not None:
+        import pygame
+        clock = pygame.time.Clock()
     path_counter = 0
     while cur_x != end_x or cur_y != end_y:
         path_counter += 1
-        clock.tick(30)
+        if clock is not None:
+            clock.tick(30)
         # apply inputs to pre-trainedneural network
-        output = net.activate((dist(cur_x, cur_y, end_x, end_y) - dist(cur_x, cur_y-1, end_x, end_y), 
-                                               dist(cur_x, cur_y, end_x, end_y) - dist(cur_x, cur_y+1, end_x, end_y),
-                                               dist(cur_x, cur_y, end_x, end_y) - dist(cur_x+1, cur_y, end_x, end_y),
-                                               dist(cur_x, cur_y, end_x, end_y) - dist(cur_x-1, cur_y, end_x, end_y)))
+        output = net.activate(sensors.inputs(cur_x, cur_y, end_x, end_y)[None])[0]
         argmax = 0
         min_val = output[0]
         for i in range(len(output)):
@@ -195,8 +216,12 @@ def solveNN(draw, grid, start, end, num_rows, genomes, config):
                 
                 
         valid = True
+        if sparse:
+            xs, ys, valid = move(np.array([cur_x]), np.array([cur_y]), MOVE_DX[argmax], MOVE_DY[argmax], grid)
+            cur_x, cur_y, valid = int(xs[0]), int(ys[0]), bool(valid[0])
+
          # Up
-        if argmax == 0:
+        elif argmax == 0:
             cur_x, cur_y, valid = moveUp(cur_x, cur_y, grid)
                 
         # Down
@@ -211,7 +236,8 @@ def solveNN(draw, grid, start, end, num_rows, genomes, config):
         elif argmax == 3:
             cur_x, cur_y, valid = moveRight(cur_x, cur_y, grid)
         
-        draw()
+        if draw is not None:
+            draw()
         
         if not valid:
             print("Failed to solve")
@@ -219,91 +245,193 @@ def solveNN(draw, grid, start, end, num_rows, genomes, config):
     
     if cur_x == end_x and cur_y == end_y:
         print("Path completed in", path_counter, "steps")
+        return True
+    return False
+
+# the compiled network is loaded once per file and shared by every query
+@functools.lru_cache(maxsize=4)
+def get_model(model_path):
+    return load_model(model_path)
+
+# One start/end query of the interactive app, solved a step at a time. Each
+# query keeps its own SparseGrid of visited blocks, so queries drawn on the
+# same window never block each other; the shared Blocks are only painted.
+class PathQuery:
+    def __init__(self, start, end, num_rows):
+        self.start = start
+        self.end = end
+        self.cur_y, self.cur_x = start.get_pos()
+        self.end_y, self.end_x = end.get_pos()
+        self.grid = SparseGrid(1, num_rows)
+        self.grid.reset(self.cur_x, self.cur_y, self.end_x, self.end_y)
+        self.steps = 0
+        self.done = False
+
+# move every unfinished query one block, with one network call for all of them
+def step_queries(queries, net, sensors, grid):
+    live = [q for q in queries if not q.done]
+    if not live:
+        return False
+    xs = np.array([q.cur_x for q in live])
+    ys = np.array([q.cur_y for q in live])
+    end_xs = np.array([q.end_x for q in live])
+    end_ys = np.array([q.end_y for q in live])
+    # the smallest output is the direction taken
+    directions = np.argmin(net.activate(sensors.inputs(xs, ys, end_xs, end_ys)), axis=1)
+
+    for q, direction in zip(live, directions.tolist()):
+        q.steps += 1
+        next_xs, next_ys, valid = move(np.array([q.cur_x]), np.array([q.cur_y]), MOVE_DX[direction], MOVE_DY[direction], q.grid)
+        if not valid[0]:
+            print("Failed to solve")
+            q.done = True
+            continue
+        q.cur_x, q.cur_y = int(next_xs[0]), int(next_ys[0])
+        grid[q.cur_x][q.cur_y].make_path()
+        if q.cur_x == q.end_x and q.cur_y == q.end_y:
+            print("Path completed in", q.steps, "steps")
+            q.done = True
+    return True
+
+# Interactive app driven by an asyncio event loop. Input, solving and drawing
+# are separate tasks on their own schedules: events are read every few
+# milliseconds, every running query moves steps_per_second times a second and
+# the window is redrawn at fps when something changed, so the window stays
+# responsive however fast or slow the queries are solved.
+#
+# Left click places a start and then an end block, as often as wanted; space
+# solves every placed pair at once; up and down double or halve the solving
+# speed; right click removes a block that is not being solved; escape clears
+# the grid.
+class PathfinderApp:
+    def __init__(self, win, width, num_rows=10, model_path=None, fps=60, steps_per_second=30):
+        if model_path is None:
+            local_dir = os.path.dirname(__file__) # gives path to current directory
+            model_path = os.path.join(local_dir, "winner.npz")
+        self.win = win
+        self.width = width
+        self.num_rows = num_rows
+        self.model_path = model_path
+        self.fps = fps
+        self.steps_per_second = steps_per_second
+        self.sensors = get_sensor_table(num_rows)
+        self.grid = make_grid(num_rows, width)
+        self.start = None
+        self.pending = []
+        self.queries = []
+        self.dirty = True
+        self.running = True
+        self.net = None
+
+    async def run(self):
+        # a missing or broken model fails here, before the window waits for input
+        self.net = get_model(self.model_path)
+        tasks = [asyncio.ensure_future(task) for task in (self._read_input(), self._solve(), self._draw())]
+        # closing the window ends the input task and an error ends any task;
+        # either way the others are stopped and the error is raised
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        self.running = False
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _read_input(self):
+        import pygame
+        while self.running:
+            for event in pygame.event.get():
+                self._handle(pygame, event)
+            await asyncio.sleep(0.005)
+
+    async def _solve(self):
+        while self.running:
+            if step_queries(self.queries, self.net, self.sensors, self.grid):
+                self.dirty = True
+            await asyncio.sleep(1 / self.steps_per_second)
+
+    async def _draw(self):
+        while self.running:
+            if self.dirty:
+                self.dirty = False
+                draw(self.win, self.grid, self.num_rows, self.width)
+            await asyncio.sleep(1 / self.fps)
+
+    # blocks of placed or running queries
+    def _in_use(self, block):
+        if block is self.start:
+            return True
+        return any(block is a or block is b for a, b in self.pending) or any(block is q.start or block is q.end for q in self.queries)
+
+    def _handle(self, pygame, event):
+        if event.type == pygame.QUIT:
+            self.running = False
+            return
+
+        # button 1 is the left mouse button, one block per click
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            row, col = get_clicked_pos(event.pos, self.num_rows, self.width)
+            block = self.grid[row][col]
+            if not self._in_use(block):
+                # a start block first, then its end block
+                if self.start is None:
+                    self.start = block
+                    block.make_start()
+                else:
+                    block.make_end()
+                    self.pending.append((self.start, block))
+                    self.start = None
+                self.dirty = True
+
+        # button 3 is the right mouse button, to reset spots
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+            row, col = get_clicked_pos(event.pos, self.num_rows, self.width)
+            block = self.grid[row][col]
+            if block is self.start:
+                self.start = None
+                block.reset()
+            for pair in self.pending:
+                if block in pair:
+                    self.pending.remove(pair)
+                    pair[0].reset()
+                    pair[1].reset()
+                    break
+            self.dirty = True
+
+        if event.type == pygame.KEYDOWN:
+            # Click space to solve every placed pair
+            if event.key == pygame.K_SPACE and self.pending:
+                self.queries.extend(PathQuery(start, end, self.num_rows) for start, end in self.pending)
+                self.pending = []
+
+            # Click up or down to change the solving speed
+            if event.key == pygame.K_UP:
+                self.steps_per_second *= 2
+                print("Solving at", self.steps_per_second, "steps per second")
+            if event.key == pygame.K_DOWN:
+                self.steps_per_second = max(1, self.steps_per_second // 2)
+                print("Solving at", self.steps_per_second, "steps per second")
+
+            # Click escape to restart the grid
+            if event.key == pygame.K_ESCAPE:
+                # reset and empty grid
+                for row in self.grid:
+                    for block in row:
+                        block.reset()
+                        block.set_score('')
+                self.start = None
+                self.pending = []
+                self.queries = []
+                self.dirty = True
 
 def main(win, width):
-    pygame.init()
-    num_rows = 10
-    grid = make_grid(num_rows, width)
-    
-    # player decides start and end location
-    start = None
-    end = None
-    
-    run = True
-    started = False
-    finished = False
-    
-    while run:
-        draw(win, grid, num_rows, width)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-            
-            # prevent user from triggering events when algorithm is underway
-            if started and not finished:
-                continue
-            
-            # [0] indicates left mouse button
-            if not started: 
-                if pygame.mouse.get_pressed()[0]:
-                    # obtains mouse position
-                    pos = pygame.mouse.get_pos()
-                    row, col = get_clicked_pos(pos, num_rows, width)
-                    
-                    # access the block object
-                    block = grid[row][col]
-                    
-                    # if the "starting" block has not been initialized, set it first
-                    if not start and block != end:
-                        start = block
-                        start.make_start()
-                        
-                    # if the "end" block has not been initialized, set it second
-                    elif not end and block != start:
-                        end = block
-                        end.make_end()
-                    
-                # [2] indicates right mouse button to reset spots
-                elif pygame.mouse.get_pressed()[2]:
-                    pos = pygame.mouse.get_pos()
-                    row, col = get_clicked_pos(pos, num_rows, width)
-                    block = grid[row][col]
-                    block.reset()
-                    if block == start:
-                        start = None
-                    if block == end:
-                        end = None
-
-            if event.type == pygame.KEYDOWN:
-                # Click space to trigger the algorithm
-                if event.key == pygame.K_SPACE and not started and start and end:
-                    started = True
-                    local_dir = os.path.dirname(__file__) # gives path to current directory
-                    config_path = os.path.join(local_dir, "neat-config.txt")
-                    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
-                    
-                    # load the pre-trained genome
-                    with open('winner.pkl', 'rb') as f:
-                        genome = pickle.load(f)
-                    
-                    genomes = [(1, genome)]
-                    solveNN(lambda:draw(win, grid, num_rows, width), grid, start, end, num_rows, genomes, config)
-                    finished = True
-                
-                # Click escape to restart the grid
-                if event.key == pygame.K_ESCAPE and started:
-                    # reset and empty grid
-                    for i in range(num_rows):
-                        for k in range(num_rows):
-                            block = grid[i][k]
-                            block.reset()
-                            block.set_score('')
-                    draw(win, grid, num_rows, width)
-                    started = False
-                    finished = False
-                    start = None
-                    end = None
-    pygame.quit()
+    import pygame
+    try:
+        asyncio.run(PathfinderApp(win, width).run())
+    finally:
+        pygame.quit()
     
 if __name__ == "__main__":
-    main(WIN, WIDTH)
+    main(open_window(WIDTH, "Pathfinding NEAT Genetic Algorithm"), WIDTH)
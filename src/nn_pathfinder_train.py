@@ -1,364 +1,190 @@
-import pygame
-import math
-import numpy as np
 import neat
 import os
 import random
 import pickle
-pygame.font.init()
+import argparse
+import multiprocessing
+
+from evaluator import ScenarioSchedule, EpisodeLimits, Observers, evaluate_genomes, parse_aggregate
+from batch_network import BatchNetwork
+from checkpoint import TrainingCheckpointer, restore_checkpoint, latest_checkpoint
+from fitness_cache import FitnessCache
+from timing import StepTimer, TimingReporter
+from frame_recorder import FrameRecorder
+from shared_grid import GridPublisher
+from obstacle_map import load_map, random_map
+from curriculum import Curriculum, parse_stages, DEFAULT_STAGES
 
 # Initialize global variables
 WIDTH = 900
-DARK_BLUE = (58, 145, 181)
-LIGHT_BLUE = (129, 198, 227)
-DARK_GREEN = (64, 125, 88)
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
-LIGHT_GREEN = (96, 224, 147)
-GREY = (206, 211, 219)
-BLUE = (0, 89, 255)
-STAT_FONT = pygame.font.SysFont("comicsans", 50)
-
-# Define class for each colored block
-class Block:
-    def __init__(self, row, col, width):
-        self.row = row
-        self.col = col
-        self.width = width
-        
-        # starting position of the drawn cubes
-        self.x = row * width
-        self.y = col * width
-        
-        # initialize all blocks to white
-        self.color = WHITE
 
-    
-    def get_pos(self):
-        return self.col, self.row
-    
-    def is_start(self):
-        return self.color == LIGHT_GREEN
+def main(genomes, config, renderer=None, pool=None, workers=1, cache=None, schedule=None, limits=None, timer=None, aggregate='mean'):
+    ge = [g for _, g in genomes]
 
-    def is_end(self):
-        return self.color == DARK_GREEN
-    
-    def is_path(self):
-        return self.color == RED
+    # every genome (and every worker) plays the same seeded list of rounds
+    if schedule is None:
+        schedule = ScenarioSchedule(12)
+    num_rows = schedule.num_rows
+    scenario_seed, scenarios = schedule.next()
+    evaluate_genomes(ge, config, scenarios, num_rows, pool=pool, workers=workers, renderer=renderer, cache=cache, scenario_seed=scenario_seed,
+                     barriers=schedule.barriers, limits=limits, timer=timer, aggregate=aggregate)
 
-    def reset(self):
-        self.color = WHITE
-        
-    def make_start(self):
-        self.color = LIGHT_GREEN
 
-    def make_end(self):
-        self.color = DARK_GREEN
-        
-    def make_path(self):
-        if not self.is_start() and not self.is_end():
-            self.color = RED 
-    
-    # draw the cube
-    def draw(self, win):
-        pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.width))
+def run(config_path, headless=False, generations=10000, fps=90, workers=1, seed=None,
+        checkpoint_interval=50, checkpoint_dir='checkpoints', resume=None, cache_size=10000, scenario_seed=None, show=25, num_rows=12, barriers=None, limits=None, timing_path=None,
+        record_dir=None, record_every=5, record_interval=1, episodes=1, aggregate='mean', publish=None, curriculum=None, curriculum_rate=0.9):
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
 
-# initialize the grid  
-def make_grid(num_rows, width, pop_size):
-    pop_scale = int(math.sqrt(pop_size))
-    grid = []
-    gap = width // (num_rows*pop_scale)
-    for i in range(num_rows):
-        grid.append([])
-        for j in range(num_rows):
-            block = Block(i, j, gap)
-            grid[i].append(block)
-    return grid
+    # a curriculum changes the grid size from stage to stage, so the run has
+    # no fixed grid to show in a window or publish
+    if curriculum is not None:
+        if barriers is not None:
+            raise ValueError("A curriculum cannot be combined with a barrier map")
+        schedule = Curriculum(curriculum, config, advance=curriculum_rate, fixed_seed=scenario_seed, episodes=episodes)
+        num_rows = curriculum[-1][0]
+        headless = True
+        publish = None
+    else:
+        schedule = ScenarioSchedule(num_rows, fixed_seed=scenario_seed, barriers=barriers, episodes=episodes)
 
-def draw_grid(win, comb_rows, width, num_rows):
-    gap = width // (comb_rows)
-    for i in range(comb_rows):
-        # draw a horizontal line to separate every row
-        if i % num_rows == 0:
-            pygame.draw.line(win, BLUE, (0, i*gap), (width, i*gap))
-        else:
-            pygame.draw.line(win, GREY, (0, i*gap), (width, i*gap))
-        
-    for j in range(comb_rows):
-        # draw a vertical line to separate every column
-        if j % num_rows == 0:
-            pygame.draw.line(win, BLUE, (j*gap, 0), (j*gap, width))
-        else:
-            pygame.draw.line(win, GREY, (j*gap, 0), (j*gap, width))
+    # a resumed run continues with the random state and the scenario seeds
+    # stored in the checkpoint
+    if resume is not None:
+        if resume == 'latest':
+            resume = latest_checkpoint(checkpoint_dir)
+            if resume is None:
+                raise FileNotFoundError("No checkpoint in {0} to resume from".format(checkpoint_dir))
+        p = restore_checkpoint(resume, config, schedule)
+        print("Resuming from", resume, "at generation", p.generation)
+    else:
+        if seed is not None:
+            random.seed(seed)
+        p = neat.Population(config)
+    p.add_reporter(neat.StdOutReporter(True))
+    stats = neat.StatisticsReporter()
+    p.add_reporter(stats)
+    if checkpoint_interval > 0:
+        p.add_reporter(TrainingCheckpointer(p, checkpoint_interval, checkpoint_dir, schedule))
+    p.add_reporter(schedule)
+    cache = None
+    if cache_size > 0:
+        cache = FitnessCache(cache_size)
+        p.add_reporter(cache)
+    # timing hooks are only passed down when a timing file is wanted
+    timer = None
+    timing = None
+    if timing_path is not None:
+        timer = StepTimer()
+        timing = TimingReporter(p, timing_path, timer)
+        p.add_reporter(timing)
 
-# draw the grids and each spots
-def draw(win, grid, comb_rows, width, num_rows, level):
-    win.fill(WHITE)
-    
-    for i in range(comb_rows):
-        for j in range(comb_rows):
-            curBlock = grid[j][i]
-            curBlock.draw(win)
-            
-    draw_grid(win, comb_rows, width, num_rows)
-    text = STAT_FONT.render("Score: " + str(level), 1, BLACK)
-    win.blit(text, (width - 10 - text.get_width(), 10))
-    pygame.display.update()
-    
-# distance calculator
-def dist(cur_x, cur_y, end_x, end_y):
-    return math.sqrt((cur_x-end_x)**2 + (cur_y-end_y)**2)
+    # pygame is only imported when someone wants to watch the run, and the
+    # window can only follow a run that is evaluated in this process, on a
+    # grid with at least a few pixels per block
+    window = None
+    if not headless and workers <= 1 and num_rows <= WIDTH // 4:
+        from training_renderer import TrainingRenderer
+        window = TrainingRenderer(WIDTH, num_rows, config.pop_size, fps, show)
 
-def moveRight(cur_x, cur_y, grid):
-    grid_width = len(grid[0])
-    
-    if cur_x + 1 < grid_width:
-        nextBlock = grid[cur_x+1][cur_y]
-        if not nextBlock.is_path():
-            nextBlock.make_path()
-            next_y, next_x = nextBlock.get_pos()
-            return next_x, next_y, 1
-    return cur_x, cur_y, 0
-    
-def moveLeft(cur_x, cur_y, grid):
-    if cur_x - 1 >= 0:
-        nextBlock = grid[cur_x-1][cur_y]
-        if not nextBlock.is_path():
-            nextBlock.make_path()
-            next_y, next_x = nextBlock.get_pos()
-            return next_x, next_y, 1
-    return cur_x, cur_y, 0
-    
-def moveDown(cur_x, cur_y, grid):
-    grid_height = len(grid)
+    # frames are copied in the fitness loop and written on a background thread
+    recorder = None
+    if record_dir is not None and workers <= 1:
+        recorder = FrameRecorder(record_dir, record_every, record_interval, show)
+        p.add_reporter(recorder)
 
-    if cur_y + 1 < grid_height: 
-        nextBlock = grid[cur_x][cur_y+1]
-        if not nextBlock.is_path():
-            nextBlock.make_path()
-            next_y, next_x = nextBlock.get_pos()
-            return next_x, next_y, 1
-    return cur_x, cur_y, 0
-    
-def moveUp(cur_x, cur_y, grid):
-    if cur_y - 1 >= 0:
-        nextBlock = grid[cur_x][cur_y-1]
-        if not nextBlock.is_path():
-            nextBlock.make_path()
-            next_y, next_x = nextBlock.get_pos()
-            return next_x, next_y, 1
-    return cur_x, cur_y, 0
+    # the grids are published to shared memory for shared_grid.py to show
+    publisher = None
+    if publish is not None and workers <= 1:
+        publisher = GridPublisher(publish, num_rows, show)
 
-def combineGrids(grids, pop_size, width):
-    # Note population count must be a SQUARE number
-    comb_grid_count = int(math.sqrt(pop_size))
-    grid_length = len(grids[0])
-    gap = width // (grid_length*comb_grid_count)
-    
-    row_count = 0
-    comb_symbols = []
-    for i in range(comb_grid_count):
-        inp_grid_segment = []
-        for j in range(grid_length):
-            inp_row = []
-            for k in range(comb_grid_count):
-                for z in range(grid_length):
-                    curBlock = grids[k + row_count][j][z]
-                    if curBlock.is_start():
-                        inp_row.append("S")
-                    elif curBlock.is_end():
-                        inp_row.append("E")
-                    elif curBlock.is_path():
-                        inp_row.append("*")
-                    else:
-                        inp_row.append(".")
-                    
-            inp_grid_segment.append(inp_row)
-        row_count += comb_grid_count
-        comb_symbols.extend(inp_grid_segment)
-    
-    comb_list = []
-    for i in range(len(comb_symbols)):
-        comb_row = []
-        for j in range(len(comb_symbols)):
-            block = Block(i, j, gap)
-            if comb_symbols[j][i] == 'S':
-                block.make_start()
-            elif comb_symbols[j][i] == 'E':
-                block.make_end()
-            elif comb_symbols[j][i] == '*':
-                block.make_path()
-            comb_row.append(block)
-        comb_list.append(comb_row)
-    return comb_list
-        
+    renderer = None
+    observers = [o for o in (window, recorder, publisher) if o is not None]
+    if len(observers) > 1:
+        renderer = Observers(*observers)
+    elif observers:
+        renderer = observers[0]
 
-def main(genomes, config):
-    pygame.init()
-    num_rows = 12
-    nets = []
-    ge = []
-    
-    # population size
-    pop_size = 25
-    comb_row_size = int(math.sqrt(pop_size))*num_rows
-    valid_list = [True] * pop_size
-    grids = [None] * pop_size
-    cur_xs = [None] * pop_size
-    cur_ys = [None] * pop_size
-    iter_loop_lost = [False] * pop_size
-    level_counter = 0
-    
-    # initialize the genomes
-    for _, g in genomes:
-        net = neat.nn.FeedForwardNetwork.create(g, config)
-        nets.append(net)
-        g.fitness = 0
-        ge.append(g)
-    
-    # create the grid and initialize start and end coordinates
-    loop_counter = 0
-    while not all(iter_loop_lost):
-        loop_counter += 1
-        if loop_counter >= 500:
-            iter_loop_lost = [True] * pop_size
-        iter_loop_finished = iter_loop_lost.copy()
-        win = pygame.display.set_mode((WIDTH, WIDTH))
-        pygame.display.set_caption("Pathfinding NEAT Genetic Algorithm")
-        
-        if not all(iter_loop_lost):
-            level_counter += 1
-        
-        # reward model for surviving longer rounds
-        for x, _ in enumerate(grids):
-            if not iter_loop_finished[x]:
-                ge[x].fitness += 5
-        
-        # determine the start and end coordinates 
-        start_x = random.randint(0, num_rows-1)
-        start_y = random.randint(0, num_rows-1)
-        end_x = start_x
-        end_y = start_y
-        while start_x == end_x and start_y == end_y:
-            end_x = random.randint(0, num_rows-1) 
-            end_y = random.randint(0, num_rows-1)
-        
-        # reset grid parameters if it is still valid
-        for j, _ in enumerate(grids):
-            if valid_list[j]:      
-                grid = make_grid(num_rows, WIDTH, pop_size)
-                cur_x = start_x
-                cur_y = start_y
-                
-                # draw the grid and initialize neural network input list
-                for y in range(num_rows):
-                    for x in range(num_rows):
-                        curBlock = grid[x][y]
-                        if x == start_x and y == start_y:
-                            curBlock.make_start()
-                        elif x == end_x and y == end_y:
-                            curBlock.make_end()
-                        else:
-                            curBlock.reset()
-                                
-                grids[j] = grid
-                cur_xs[j] = cur_x
-                cur_ys[j] = cur_y
-                iter_loop_finished[j] = False
-        
-        # combine all grids into one grid
-        comb_grid = combineGrids(grids, pop_size, WIDTH)
-        draw(win, comb_grid, comb_row_size, WIDTH, num_rows, level_counter)
-        
-        step_counter = 0
-        clock = pygame.time.Clock()
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
 
-        while not all(iter_loop_finished):
-            clock.tick(90)  # n ticks per second
-            # add an option to quit in the middle of the algorithm    
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    
-            for x, grid in enumerate(grids):
-                if valid_list[x] and not iter_loop_finished[x]:
-                    # punish model for very long paths
-                    ge[x].fitness -= 0.2
-                    
-                    output = nets[x].activate((dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x], cur_ys[x]-1, end_x, end_y), 
-                                               dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x], cur_ys[x]+1, end_x, end_y),
-                                               dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x]+1, cur_ys[x], end_x, end_y),
-                                               dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x]-1, cur_ys[x], end_x, end_y)))
-                    
-                    # find the argmax of the four directions
-                    argmax = 0
-                    min_val = output[0]
-                    for w in range(len(output)):
-                        if output[w] < min_val:
-                            min_val = output[w]
-                            argmax = w
-                    
-                    # Up
-                    if argmax == 0:
-                        cur_xs[x], cur_ys[x], valid = moveUp(cur_xs[x], cur_ys[x], grid)
-                        # reward for moving closer to end
-                        ge[x].fitness += (dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x], cur_ys[x]-1, end_x, end_y))/2
-                        # print("Up")
-                            
-                    # Down
-                    elif argmax == 1:
-                        cur_xs[x], cur_ys[x], valid = moveDown(cur_xs[x], cur_ys[x], grid)
-                        # reward for moving closer to end
-                        ge[x].fitness += (dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x], cur_ys[x]+1, end_x, end_y))/2
-                        # print("Down")
-                            
-                    # Left
-                    elif argmax == 2:
-                        cur_xs[x], cur_ys[x], valid = moveLeft(cur_xs[x], cur_ys[x], grid)
-                        # reward for moving closer to end
-                        ge[x].fitness += (dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x]-1, cur_ys[x], end_x, end_y))/2
-                        # print("Left")
-                            
-                    # Right
-                    elif argmax == 3:
-                        cur_xs[x], cur_ys[x], valid = moveRight(cur_xs[x], cur_ys[x], grid)
-                        # reward for moving closer to end
-                        ge[x].fitness += (dist(cur_xs[x], cur_ys[x], end_x, end_y) - dist(cur_xs[x]+1, cur_ys[x], end_x, end_y))/2
-                        # print("Right")
-                        
-                    if not valid:
-                        # reduce fitness score if path crashes
-                        ge[x].fitness = -1
-                        valid_list[x] = False
-                        iter_loop_finished[x] = True
-                        iter_loop_lost[x] = True
-                        break
-                        
-                    if cur_xs[x] == end_x and cur_ys[x] == end_y:
-                        # increase fitness if end target reached
-                        step_boost = 10
-                        ge[x].fitness += step_boost
-                        iter_loop_finished[x] = True
-                        
-            
-            comb_grid = combineGrids(grids, pop_size, WIDTH)
-            draw(win, comb_grid, comb_row_size, WIDTH, num_rows, level_counter)
-            
+    def evaluate(genomes, config):
+        main(genomes, config, renderer=renderer, pool=pool, workers=workers, cache=cache, schedule=schedule,
+             limits=limits, timer=timer, aggregate=aggregate)
 
-    
-    
-def run(config_path):
-    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
-    p = neat.Population(config) 
-    p.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
-    p.add_reporter(stats)
-    
-    winner = p.run(main,10000) # number of generations
+    try:
+        winner = p.run(evaluate, generations - p.generation) # number of generations
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if window is not None:
+            window.close()
+        if recorder is not None:
+            recorder.close()
+        if publisher is not None:
+            publisher.close()
+        if timing is not None:
+            timing.close()
+        # the scenario seeds of every generation (including those before a
+        # resumed checkpoint), to replay or audit the run
+        schedule.save('scenarios.npz')
+    # neat's best genome may come from an earlier, smaller stage
+    if curriculum is not None and schedule.best_genome is not None:
+        winner = schedule.best_genome
     pickle.dump(winner, open('winner.pkl', 'wb'))
+
+    # compiled copy of the winner for fast, neat-free inference
+    BatchNetwork.create([winner], config).save('winner.npz')
     
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the NEAT pathfinder")
+    parser.add_argument("--headless", action="store_true", help="run the fitness loop without a display or frame clock")
+    parser.add_argument("--generations", type=int, default=10000, help="maximum number of generations")
+    parser.add_argument("--fps", type=int, default=90, help="frame rate cap of the training window")
+    parser.add_argument("--rows", type=int, default=12, help="grid size of the training rounds (very large grids are simulated sparsely)")
+    parser.add_argument("--curriculum", nargs="?", const=DEFAULT_STAGES, help="train in stages of growing grid size and start to end distance, given as rows[:largest distance],... (default " + DEFAULT_STAGES + ")")
+    parser.add_argument("--curriculum-rate", type=float, default=0.9, help="share of a stage's routes the best genome has to solve before the curriculum moves on")
+    parser.add_argument("--map", help="barrier map (.npy) every round is played on; its size overrides --rows")
+    parser.add_argument("--obstacles", type=float, default=0.0, help="share of blocks turned into barriers on a random map (seeded by --seed)")
+    parser.add_argument("--step-budget", type=float, default=3.0, help="steps allowed per round as a multiple of the shortest route (0 disables the budget)")
+    parser.add_argument("--stall-steps", type=int, default=12, help="steps an agent may take without getting closer to the end (0 disables the check)")
+    parser.add_argument("--episodes", type=int, default=1, help="independent round lists every genome plays per generation")
+    parser.add_argument("--fitness-aggregate", type=parse_aggregate, default="mean", help="how the episode fitnesses are combined: mean, or a quantile such as 0.25")
+    parser.add_argument("--timing", help="write the time spent per generation in each part of training to this .jsonl (or .csv) file")
+    parser.add_argument("--record", help="directory to write PNG frames of the training grids to (needs --workers 1)")
+    parser.add_argument("--record-every", type=int, default=5, help="record every n-th step")
+    parser.add_argument("--record-interval", type=int, default=1, help="record every n-th generation")
+    parser.add_argument("--publish", nargs="?", const="pathfinder", help="publish the training grids to this shared memory block for shared_grid.py to show (needs --workers 1)")
+    parser.add_argument("--show", type=int, default=25, help="number of best genomes tiled in the training window")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes evaluating the population (implies --headless when above 1)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for evolution and scenario generation")
+    parser.add_argument("--checkpoint-interval", type=int, default=50, help="generations between checkpoints (0 disables them)")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="directory the checkpoints are written to")
+    parser.add_argument("--scenario-seed", type=int, default=None, help="play the same seeded scenario set in every generation instead of a new one each time")
+    parser.add_argument("--fitness-cache", type=int, default=10000, help="number of genome fitnesses remembered per scenario set (0 disables the cache)")
+    parser.add_argument("--resume", nargs="?", const="latest", help="checkpoint file to resume from (the newest one in --checkpoint-dir when no file is given)")
+    args = parser.parse_args()
+    if args.resume == "latest":
+        args.resume = latest_checkpoint(args.checkpoint_dir)
+        if args.resume is None:
+            parser.error("--resume: no checkpoint in {0}".format(args.checkpoint_dir))
+    elif args.resume is not None and not os.path.isfile(args.resume):
+        parser.error("--resume: no checkpoint file {0}".format(args.resume))
+
     local_dir = os.path.dirname(__file__) # gives path to current directory
     config_path = os.path.join(local_dir, "neat-config.txt")
-    run(config_path)
+    barriers = None
+    if args.map:
+        barriers = load_map(args.map)
+        args.rows = len(barriers)
+    elif args.obstacles > 0:
+        barriers = random_map(args.rows, args.obstacles, args.seed)
+    # agents that wander off are cut early, so no round runs for long
+    limits = EpisodeLimits(args.step_budget or None, 2, args.stall_steps or None)
+    run(config_path, headless=args.headless, generations=args.generations, fps=args.fps, workers=args.workers, seed=args.seed,
+        checkpoint_interval=args.checkpoint_interval, checkpoint_dir=args.checkpoint_dir, resume=args.resume,
+        cache_size=args.fitness_cache, scenario_seed=args.scenario_seed, show=args.show, num_rows=args.rows, barriers=barriers,
+        limits=limits, timing_path=args.timing, record_dir=args.record, record_every=args.record_every,
+        record_interval=args.record_interval, episodes=args.episodes, aggregate=args.fitness_aggregate, publish=args.publish,
+        curriculum=parse_stages(args.curriculum) if args.curriculum else None, curriculum_rate=args.curriculum_rate)
@@ -0,0 +1,156 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+from sensor_table import DIRECTION_INPUT
+
+# x and y offsets of the network inputs (up, down, right, left)
+INPUT_DX = np.array([0, 0, 1, -1])
+INPUT_DY = np.array([-1, 1, 0, 0])
+
+# Barrier maps are (rows, cols) boolean arrays indexed [x, y] like the grids,
+# True where a block is a barrier.
+
+# random map with roughly the given share of barrier blocks
+def random_map(num_rows, density, seed=None, num_cols=None):
+    if num_cols is None:
+        num_cols = num_rows
+    rng = np.random.default_rng(seed)
+    return rng.random((num_rows, num_cols)) < density
+
+# maps are stored as .npy boolean arrays
+def load_map(path):
+    return np.load(path).astype(bool)
+
+def save_map(path, barriers):
+    np.save(path, np.asarray(barriers, dtype=bool))
+
+def map_hash(barriers):
+    barriers = np.asarray(barriers, dtype=bool)
+    return hashlib.sha1(repr(barriers.shape).encode() + np.packbits(barriers).tobytes()).hexdigest()
+
+# Number of steps from every block to (end_x, end_y) moving up, down, left
+# and right around barriers; inf for barriers and blocks that cannot reach
+# it. The breadth-first search expands one whole frontier per step.
+def bfs_distances(barriers, end_x, end_y):
+    barriers = np.asarray(barriers, dtype=bool)
+    num_rows, num_cols = barriers.shape
+    if barriers[end_x, end_y]:
+        raise ValueError("Target ({0}, {1}) is a barrier".format(end_x, end_y))
+    distances = np.full(num_rows*num_cols, np.inf)
+    unseen = ~barriers.ravel()
+    frontier = np.array([end_x*num_cols + end_y])
+    unseen[frontier] = False
+    steps = 0
+    while len(frontier):
+        distances[frontier] = steps
+        steps += 1
+        xs, ys = np.divmod(frontier, num_cols)
+        neighbours = np.concatenate((frontier[xs > 0] - num_cols, frontier[xs < num_rows - 1] + num_cols,
+                                     frontier[ys > 0] - 1, frontier[ys < num_cols - 1] + 1))
+        frontier = np.unique(neighbours[unseen[neighbours]])
+        unseen[frontier] = False
+    return distances.reshape(num_rows, num_cols)
+
+# Distance field of one (map, target) pair with the network inputs of every
+# block: the distance a step up, down, right or left gains towards the
+# target. A step into a barrier or off the grid counts as a step away.
+class DistanceField:
+    def __init__(self, barriers, end_x, end_y):
+        self.distances = bfs_distances(barriers, end_x, end_y)
+        reachable = np.isfinite(self.distances)
+        padded = np.pad(self.distances, 1, constant_values=np.inf)
+        num_rows, num_cols = self.distances.shape
+        neighbours = np.stack([padded[1 + dx:1 + dx + num_rows, 1 + dy:1 + dy + num_cols] for dx, dy in zip(INPUT_DX, INPUT_DY)], axis=-1)
+        neighbours = np.where(np.isfinite(neighbours), neighbours, self.distances[..., None] + 1)
+        with np.errstate(invalid='ignore'):
+            self.gains = np.where(reachable[..., None], self.distances[..., None] - neighbours, 0.0)
+
+    def reachable(self, xs, ys):
+        return np.isfinite(self.distances[xs, ys])
+
+    def nbytes(self):
+        return self.distances.nbytes + self.gains.nbytes
+
+# Map from (map hash, target) to its DistanceField, evicting the least
+# recently used fields once they take more than max_bytes, so every target of
+# a map is searched once however many rounds or steps use it. The bound is in
+# bytes so small maps keep many more targets than large ones.
+class DistanceFieldCache:
+    def __init__(self, max_bytes=1 << 29):
+        self.max_bytes = max_bytes
+        self.fields = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, barriers, end_x, end_y, key=None):
+        if key is None:
+            key = map_hash(barriers)
+        field_key = (key, int(end_x), int(end_y))
+        field = self.fields.get(field_key)
+        if field is not None:
+            self.fields.move_to_end(field_key)
+            self.hits += 1
+            return field
+        self.misses += 1
+        field = DistanceField(barriers, end_x, end_y)
+        self.fields[field_key] = field
+        self.size += field.nbytes()
+        while self.size > self.max_bytes and len(self.fields) > 1:
+            _, evicted = self.fields.popitem(last=False)
+            self.size -= evicted.nbytes()
+        return field
+
+# shared by every caller in the process
+distance_fields = DistanceFieldCache()
+
+# routes that cannot be played on a barrier map: a start or end on a barrier,
+# a start on its end, or an end that cannot be reached from the start;
+# starts and ends are (routes, 2) arrays of (x, y)
+def blocked_routes(barriers, starts, ends):
+    blocked = barriers[starts[:, 0], starts[:, 1]] | barriers[ends[:, 0], ends[:, 1]]
+    blocked |= (starts == ends).all(axis=1)
+    key = map_hash(barriers)
+    for i in np.flatnonzero(~blocked).tolist():
+        field = distance_fields.get(barriers, ends[i, 0], ends[i, 1], key)
+        blocked[i] = not field.reachable(starts[i, 0], starts[i, 1])
+    return blocked
+
+# Same interface as SensorTable for a map with barriers: the inputs and
+# rewards come from the BFS distance field of the target instead of the
+# straight-line distance. Targets may be one block or one per agent.
+class ObstacleSensors:
+    def __init__(self, barriers, cache=None):
+        self.barriers = np.asarray(barriers, dtype=bool)
+        self.num_rows, self.num_cols = self.barriers.shape
+        self.key = map_hash(self.barriers)
+        self.cache = distance_fields if cache is None else cache
+
+    def field(self, end_x, end_y):
+        return self.cache.get(self.barriers, end_x, end_y, self.key)
+
+    def inputs(self, xs, ys, end_x, end_y):
+        if np.ndim(end_x) == 0:
+            return self.field(end_x, end_y).gains[xs, ys]
+        inputs = np.empty(np.shape(xs) + (4,))
+        ends = np.stack((end_x, end_y), axis=-1)
+        for end in np.unique(ends, axis=0).tolist():
+            same = (ends == end).all(axis=-1)
+            inputs[same] = self.field(*end).gains[xs[same], ys[same]]
+        return inputs
+
+    # length of the shortest route around the barriers
+    def route_length(self, xs, ys, end_x, end_y):
+        if np.ndim(end_x) == 0:
+            return self.field(end_x, end_y).distances[xs, ys]
+        lengths = np.empty(np.shape(xs))
+        ends = np.stack((end_x, end_y), axis=-1)
+        for end in np.unique(ends, axis=0).tolist():
+            same = (ends == end).all(axis=-1)
+            lengths[same] = self.field(*end).distances[xs[same], ys[same]]
+        return lengths
+
+    def rewards(self, xs, ys, end_x, end_y, directions):
+        inputs = self.inputs(xs, ys, end_x, end_y)
+        return np.take_along_axis(inputs, DIRECTION_INPUT[directions][..., None], axis=-1)[..., 0] / 2
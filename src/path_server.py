@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+from path_solver import load_model, solve_paths
+
+# Bounded map from (rows, start_x, start_y, end_x, end_y) to a solved route,
+# evicting the least recently used route when full; shared by every thread
+class QueryCache:
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+# Latency of the most recent requests and the totals since start
+class LatencyStats:
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.errors += error
+
+    def snapshot(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            uptime = time.perf_counter() - self.started
+            stats = {'requests': self.requests, 'errors': self.errors, 'uptime_s': uptime,
+                     'throughput_per_s': self.requests / uptime if uptime > 0 else 0.0}
+        if len(latencies):
+            stats['p50_ms'] = float(np.percentile(latencies, 50))*1000
+            stats['p99_ms'] = float(np.percentile(latencies, 99))*1000
+        return stats
+
+# Collects the queries of concurrent requests and solves every grid size's
+# pending queries in one batched solve_paths call, so the network runs once
+# per batch instead of once per request. The batches of different grid sizes
+# are solved on `workers` threads, smaller grids first, so a large grid does
+# not hold up the small ones; queries arriving while every worker is busy
+# wait for the next batch. A query gives up after max_steps steps.
+class QueryBatcher:
+    def __init__(self, net, workers=4, max_steps=None):
+        self.net = net
+        self.workers = workers
+        self.max_steps = max_steps
+        self.pending = []
+        self.busy = 0
+        self.ready = threading.Condition()
+        self.executor = ThreadPoolExecutor(workers)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, num_rows, start, end):
+        future = Future()
+        with self.ready:
+            self.pending.append((num_rows, start, end, future))
+            self.ready.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self.ready:
+                while not self.pending or self.busy >= self.workers:
+                    self.ready.wait()
+                batch, self.pending = self.pending, []
+                sizes = sorted(set(q[0] for q in batch))
+                self.busy += len(sizes)
+            for num_rows in sizes:
+                self.executor.submit(self._solve, num_rows, [q for q in batch if q[0] == num_rows])
+
+    def _solve(self, num_rows, queries):
+        try:
+            paths, success = solve_paths(self.net, [q[1] for q in queries], [q[2] for q in queries], num_rows, max_steps=self.max_steps)
+        except Exception as e:
+            for q in queries:
+                q[3].set_exception(e)
+        else:
+            for q, path, solved in zip(queries, paths, success.tolist()):
+                q[3].set_result((path, solved))
+        finally:
+            with self.ready:
+                self.busy -= 1
+                self.ready.notify()
+
+# Answers path requests with a model loaded once. A request is a JSON object
+# {"id": ..., "rows": 10, "start": [x, y], "end": [x, y]}, answered with
+# {"id": ..., "path": [[x, y], ...], "success": true, "cached": false};
+# {"stats": true} returns the latency, throughput and cache counters.
+# Identical queries in flight at the same time share one solve.
+class PathService:
+    def __init__(self, net, cache_size=100000, max_rows=100000, workers=4, max_steps=10000):
+        self.batcher = QueryBatcher(net, workers, max_steps)
+        self.cache = QueryCache(cache_size)
+        self.stats = LatencyStats()
+        self.max_rows = max_rows
+        self.inflight = {}
+        self.lock = threading.RLock()
+
+    def _parse(self, request):
+        num_rows = int(request['rows'])
+        start = [int(v) for v in request['start']]
+        end = [int(v) for v in request['end']]
+        if not 2 <= num_rows <= self.max_rows:
+            raise ValueError("rows must be between 2 and {0}".format(self.max_rows))
+        if len(start) != 2 or len(end) != 2 or not all(0 <= v < num_rows for v in start + end):
+            raise ValueError("start and end must be [x, y] blocks inside the grid")
+        return num_rows, start, end
+
+    def handle(self, request):
+        if request.get('stats'):
+            stats = self.stats.snapshot()
+            stats.update(cache_hits=self.cache.hits, cache_misses=self.cache.misses, cache_size=len(self.cache.entries))
+            return {'id': request.get('id'), 'stats': stats}
+
+        t = time.perf_counter()
+        try:
+            num_rows, start, end = self._parse(request)
+            key = (num_rows, start[0], start[1], end[0], end[1])
+            with self.lock:
+                result = self.cache.get(key)
+                if result is None:
+                    future = self.inflight.get(key)
+                    if future is None:
+                        future = self.batcher.submit(num_rows, start, end)
+                        self.inflight[key] = future
+                        future.add_done_callback(lambda f, key=key: self._solved(key, f))
+            cached = result is not None
+            if not cached:
+                result = future.result()
+            path, success = result
+            response = {'id': request.get('id'), 'path': [list(p) for p in path], 'success': success, 'cached': cached}
+            error = False
+        except Exception as e:
+            response = {'id': request.get('id'), 'error': str(e) or type(e).__name__}
+            error = True
+        self.stats.record(time.perf_counter() - t, error)
+        return response
+
+    # a solved route is cached before its query stops being in flight, so a
+    # repeated query always finds one of the two
+    def _solved(self, key, future):
+        with self.lock:
+            if future.exception() is None:
+                self.cache.put(key, future.result())
+            del self.inflight[key]
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            self.stats.record(0.0, True)
+            return json.dumps({'id': None, 'error': "invalid request: " + str(e)})
+        return json.dumps(self.handle(request))
+
+# one thread per connection, one JSON request per line
+class PathRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write((self.server.service.handle_line(line) + '\n').encode())
+                self.wfile.flush()
+
+class PathServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        self.service = service
+        socketserver.TCPServer.__init__(self, address, PathRequestHandler)
+
+# JSON lines on stdin and stdout; requests are answered as they complete, so
+# responses can come back out of order and carry the request id
+def serve_stdio(service, workers=8):
+    write_lock = threading.Lock()
+
+    def answer(line):
+        response = service.handle_line(line)
+        with write_lock:
+            sys.stdout.write(response + '\n')
+            sys.stdout.flush()
+
+    with ThreadPoolExecutor(workers) as executor:
+        for line in sys.stdin:
+            if line.strip():
+                executor.submit(answer, line)
+
+if __name__ == "__main__":
+    local_dir = os.path.dirname(__file__) # gives path to current directory
+    parser = argparse.ArgumentParser(description="Serve path queries from the compiled winner network")
+    parser.add_argument("--model", default=os.path.join(local_dir, "winner.npz"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stdio", action="store_true", help="read requests from stdin and answer on stdout instead of a socket")
+    parser.add_argument("--cache-size", type=int, default=100000, help="number of solved routes remembered")
+    parser.add_argument("--workers", type=int, default=4, help="threads solving the batches of different grid sizes side by side")
+    parser.add_argument("--max-steps", type=int, default=10000, help="steps a query may take before it is given up as failed")
+    args = parser.parse_args()
+
+    service = PathService(load_model(args.model), args.cache_size, workers=args.workers, max_steps=args.max_steps)
+    if args.stdio:
+        serve_stdio(service)
+    else:
+        with PathServer((args.host, args.port), service) as server:
+            print("Serving path queries on {0}:{1}".format(args.host, args.port))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,140 @@
+import argparse
+import os
+import time
+import numpy as np
+
+from pathfinder_env import make_grid, move, MOVE_DX, MOVE_DY
+from batch_network import BatchNetwork
+from sensor_table import get_sensor_table
+from obstacle_map import ObstacleSensors, blocked_routes, load_map
+
+# turn a pickled winner genome into a compiled .npz network, which loads
+# without neat-python
+def compile_winner(genome_path, config_path, model_path):
+    import pickle
+    import neat
+
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+    with open(genome_path, 'rb') as f:
+        genome = pickle.load(f)
+    net = BatchNetwork.create([genome], config)
+    net.save(model_path)
+    return net
+
+def load_model(model_path):
+    return BatchNetwork.load(model_path)
+
+# Run the network on many (start, end) queries at once. starts and ends are
+# (queries, 2) arrays of (x, y). Every query walks its own grid until it
+# reaches its end or crashes into the border or its own path, exactly as
+# solveNN does one block at a time. Returns the list of visited (x, y) blocks
+# of every query (start included) and a boolean success array. On a barrier
+# map the network senses the BFS distance to its end, as in training. With
+# max_steps, queries still walking after that many steps are given up as
+# failed.
+def solve_paths(net, starts, ends, num_rows, barriers=None, max_steps=None):
+    starts = np.asarray(starts, dtype=np.int64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+    queries = len(starts)
+    grid = make_grid(num_rows, queries, barriers=barriers)
+    agents = grid.all_agents
+    sensors = get_sensor_table(num_rows) if barriers is None else ObstacleSensors(barriers)
+
+    start_xs, start_ys = starts[:, 0], starts[:, 1]
+    end_xs, end_ys = ends[:, 0], ends[:, 1]
+    grid.reset(start_xs, start_ys, end_xs, end_ys)
+    cur_xs = start_xs.copy()
+    cur_ys = start_ys.copy()
+
+    success = (start_xs == end_xs) & (start_ys == end_ys)
+    finished = success.copy()
+    steps = [(agents, cur_xs.copy(), cur_ys.copy())]
+
+    while not finished.all() and (max_steps is None or len(steps) <= max_steps):
+        live = agents[~finished]
+        xs = cur_xs[live]
+        ys = cur_ys[live]
+        live_end_xs = end_xs[live]
+        live_end_ys = end_ys[live]
+
+        # the smallest output is the direction taken
+        directions = np.argmin(net.activate(sensors.inputs(xs, ys, live_end_xs, live_end_ys)), axis=1)
+        xs, ys, valid = move(xs, ys, MOVE_DX[directions], MOVE_DY[directions], grid, live)
+        cur_xs[live] = xs
+        cur_ys[live] = ys
+        steps.append((live[valid], xs[valid], ys[valid]))
+
+        reached = valid & (xs == live_end_xs) & (ys == live_end_ys)
+        success[live[reached]] = True
+        finished[live[reached | ~valid]] = True
+
+    # regroup the per-step moves into one path per query
+    order_agents = np.concatenate([a for a, _, _ in steps])
+    order_xs = np.concatenate([x for _, x, _ in steps])
+    order_ys = np.concatenate([y for _, _, y in steps])
+    order = np.argsort(order_agents, kind='stable')
+    bounds = np.searchsorted(order_agents[order], np.arange(queries + 1))
+    points = list(zip(order_xs[order].tolist(), order_ys[order].tolist()))
+    paths = [points[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+    return paths, success
+
+# random distinct (start, end) pairs for offline evaluation, all of them
+# solvable when a barrier map is given
+def random_queries(num_rows, count, seed=None, barriers=None):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, num_rows, size=(count, 2))
+    ends = rng.integers(0, num_rows, size=(count, 2))
+    same = (starts == ends).all(axis=1)
+    while same.any():
+        ends[same] = rng.integers(0, num_rows, size=(same.sum(), 2))
+        same = (starts == ends).all(axis=1)
+
+    if barriers is not None:
+        blocked = blocked_routes(barriers, starts, ends)
+        while blocked.any():
+            starts[blocked] = rng.integers(0, num_rows, size=(blocked.sum(), 2))
+            ends[blocked] = rng.integers(0, num_rows, size=(blocked.sum(), 2))
+            blocked = blocked_routes(barriers, starts, ends)
+    return starts, ends
+
+if __name__ == "__main__":
+    local_dir = os.path.dirname(__file__) # gives path to current directory
+    parser = argparse.ArgumentParser(description="Compile the winner genome and evaluate it on batches of routes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = subparsers.add_parser("compile", help="compile a pickled genome into an .npz network")
+    compile_parser.add_argument("--genome", default=os.path.join(local_dir, "winner.pkl"))
+    compile_parser.add_argument("--config", default=os.path.join(local_dir, "neat-config.txt"))
+    compile_parser.add_argument("--model", default=os.path.join(local_dir, "winner.npz"))
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="solve random routes with a compiled network")
+    evaluate_parser.add_argument("--model", default=os.path.join(local_dir, "winner.npz"))
+    evaluate_parser.add_argument("--rows", type=int, default=10)
+    evaluate_parser.add_argument("--queries", type=int, default=10000)
+    evaluate_parser.add_argument("--seed", type=int, default=None)
+    evaluate_parser.add_argument("--map", help="barrier map (.npy) to solve the routes on; its size overrides --rows")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        compile_winner(args.genome, args.config, args.model)
+        print("Saved compiled network to", args.model)
+    else:
+        t = time.perf_counter()
+        net = load_model(args.model)
+        load_time = time.perf_counter() - t
+
+        barriers = None
+        if args.map:
+            barriers = load_map(args.map)
+            args.rows = len(barriers)
+        starts, ends = random_queries(args.rows, args.queries, args.seed, barriers)
+        t = time.perf_counter()
+        paths, success = solve_paths(net, starts, ends, args.rows, barriers)
+        solve_time = time.perf_counter() - t
+
+        lengths = np.array([len(p) - 1 for p in paths])
+        print("Loaded model in {0:.2f} ms".format(load_time*1000))
+        print("Solved {0} routes on a {1}x{1} grid in {2:.3f} s".format(args.queries, args.rows, solve_time))
+        print("Success rate: {0:.2%}".format(success.mean()))
+        if success.any():
+            print("Mean path length of solved routes: {0:.2f} steps".format(lengths[success].mean()))
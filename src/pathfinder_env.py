@@ -0,0 +1,155 @@
+import math
+import numpy as np
+
+# Initialize global variables
+DARK_BLUE = (58, 145, 181)
+LIGHT_BLUE = (129, 198, 227)
+DARK_GREEN = (64, 125, 88)
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+LIGHT_GREEN = (96, 224, 147)
+GREY = (206, 211, 219)
+BLUE = (0, 89, 255)
+
+# cell states stored in the population grid
+EMPTY = 0
+PATH = 1
+START = 2
+END = 3
+BARRIER = 4
+
+# color of every cell state, indexed by state
+STATE_COLORS = [WHITE, RED, LIGHT_GREEN, DARK_GREEN, BLACK]
+
+# x and y offsets of the network outputs (up, down, left, right)
+MOVE_DX = np.array([0, 0, -1, 1])
+MOVE_DY = np.array([-1, 1, 0, 0])
+
+# Grid state of a whole population held in one (population, rows, cols)
+# uint8 array; cells are indexed [genome, x, y] like the old grid[x][y].
+# An optional (rows, cols) boolean barrier map is laid under every grid.
+class PopulationGrid:
+    def __init__(self, pop_size, num_rows, num_cols=None, barriers=None):
+        if num_cols is None:
+            num_cols = num_rows
+        self.pop_size = pop_size
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cells = np.zeros((pop_size, num_rows, num_cols), dtype=np.uint8)
+        self.all_agents = np.arange(pop_size)
+        self.background = EMPTY
+        if barriers is not None:
+            self.background = np.where(barriers, BARRIER, EMPTY).astype(np.uint8)
+            self.cells[:] = self.background
+
+    # clear the selected grids and place their start and end blocks
+    def reset(self, start_x, start_y, end_x, end_y, agents=None):
+        if agents is None:
+            agents = self.all_agents
+        self.cells[agents] = self.background
+        self.cells[agents, start_x, start_y] = START
+        self.cells[agents, end_x, end_y] = END
+
+    # blocks an agent crashes into: its own path and barriers
+    def is_blocked(self, agents, xs, ys):
+        cells = self.cells[agents, xs, ys]
+        return (cells == PATH) | (cells == BARRIER)
+
+    # start and end blocks are never painted over, as with Block.make_path
+    def make_path(self, agents, xs, ys):
+        cur = self.cells[agents, xs, ys]
+        self.cells[agents, xs, ys] = np.where(cur == EMPTY, PATH, cur)
+
+# Grid state of a population for grids too large to hold as cells: only the
+# start and end block of every genome and a set of the blocks on its path are
+# kept, so memory grows with the path length instead of the grid area and a
+# self-collision check is one set lookup. Used headless, it has no cells to
+# draw. A barrier map, if given, is shared by the whole population.
+class SparseGrid:
+    def __init__(self, pop_size, num_rows, num_cols=None, barriers=None):
+        if num_cols is None:
+            num_cols = num_rows
+        self.pop_size = pop_size
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.all_agents = np.arange(pop_size)
+        self.starts = np.zeros((pop_size, 2), dtype=np.int64)
+        self.ends = np.zeros((pop_size, 2), dtype=np.int64)
+        self.paths = [set() for _ in range(pop_size)]
+        self.barriers = None if barriers is None else np.asarray(barriers, dtype=bool)
+
+    # agents may be given as indices or as a boolean mask, as with the cells
+    def reset(self, start_x, start_y, end_x, end_y, agents=None):
+        agents = self.all_agents if agents is None else self.all_agents[agents]
+        for a in agents.tolist():
+            self.paths[a].clear()
+        self.starts[agents, 0] = start_x
+        self.starts[agents, 1] = start_y
+        self.ends[agents, 0] = end_x
+        self.ends[agents, 1] = end_y
+
+    def is_blocked(self, agents, xs, ys):
+        paths = self.paths
+        blocks = xs*self.num_cols + ys
+        blocked = np.array([b in paths[a] for a, b in zip(agents.tolist(), blocks.tolist())], dtype=bool)
+        if self.barriers is not None:
+            blocked |= self.barriers[xs, ys]
+        return blocked
+
+    # start and end blocks are never painted over, as with Block.make_path
+    def make_path(self, agents, xs, ys):
+        start = (xs == self.starts[agents, 0]) & (ys == self.starts[agents, 1])
+        end = (xs == self.ends[agents, 0]) & (ys == self.ends[agents, 1])
+        paint = ~(start | end)
+        paths = self.paths
+        blocks = xs[paint]*self.num_cols + ys[paint]
+        for a, b in zip(agents[paint].tolist(), blocks.tolist()):
+            paths[a].add(b)
+
+# largest population grid (in cells) make_grid holds densely by default
+DENSE_CELL_LIMIT = 100000000
+
+# initialize the grid; sparse=None picks the sparse grid for very large grids
+def make_grid(num_rows, pop_size, sparse=None, barriers=None):
+    if sparse is None:
+        sparse = pop_size*num_rows*num_rows > DENSE_CELL_LIMIT
+    if sparse:
+        return SparseGrid(pop_size, num_rows, barriers=barriers)
+    return PopulationGrid(pop_size, num_rows, barriers=barriers)
+
+# move every selected agent by (dx, dy) at once; an agent whose next block is
+# off the grid, a barrier or already on its path stays put and gets
+# valid == False
+def move(cur_xs, cur_ys, dxs, dys, grid, agents=None):
+    if agents is None:
+        agents = grid.all_agents
+    next_xs = cur_xs + dxs
+    next_ys = cur_ys + dys
+    valid = (next_xs >= 0) & (next_xs < grid.num_rows) & (next_ys >= 0) & (next_ys < grid.num_cols)
+    inside = np.flatnonzero(valid)
+    valid[inside] = ~grid.is_blocked(agents[inside], next_xs[inside], next_ys[inside])
+
+    moved = np.flatnonzero(valid)
+    grid.make_path(agents[moved], next_xs[moved], next_ys[moved])
+    return np.where(valid, next_xs, cur_xs), np.where(valid, next_ys, cur_ys), valid
+
+def moveRight(cur_xs, cur_ys, grid, agents=None):
+    return move(cur_xs, cur_ys, 1, 0, grid, agents)
+
+def moveLeft(cur_xs, cur_ys, grid, agents=None):
+    return move(cur_xs, cur_ys, -1, 0, grid, agents)
+
+def moveDown(cur_xs, cur_ys, grid, agents=None):
+    return move(cur_xs, cur_ys, 0, 1, grid, agents)
+
+def moveUp(cur_xs, cur_ys, grid, agents=None):
+    return move(cur_xs, cur_ys, 0, -1, grid, agents)
+
+# tile every grid of the population into one square state matrix
+def combineGrids(grid, agents=None):
+    # only the largest square number of grids (of the given agents) is shown
+    cells = grid.cells if agents is None else grid.cells[agents]
+    comb_grid_count = int(math.sqrt(len(cells)))
+    tiles = cells[:comb_grid_count**2].reshape(comb_grid_count, comb_grid_count, grid.num_rows, grid.num_cols)
+    return tiles.transpose(1, 2, 0, 3).reshape(comb_grid_count*grid.num_rows, comb_grid_count*grid.num_cols)
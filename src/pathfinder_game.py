@@ -1,7 +1,9 @@
-import pygame
 import math
 import numpy as np
 
+from obstacle_map import save_map
+from astar import astar
+
 # Initialize global variables
 WIDTH = 900
 DARK_BLUE = (58, 145, 181)
@@ -12,8 +14,15 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 LIGHT_GREEN = (96, 224, 147)
 GREY = (128, 128, 128)
-WIN = pygame.display.set_mode((WIDTH, WIDTH))
-pygame.display.set_caption("Pathfinding with A* Algorithm")
+
+# pygame and the window are only set up when the app is run, so the grid
+# helpers can be imported by scripts and tests without a display
+def open_window(width, caption):
+    import pygame
+    pygame.init()
+    win = pygame.display.set_mode((width, width))
+    pygame.display.set_caption(caption)
+    return win
 
 # Define class for each colored block
 class Block:
@@ -60,6 +69,7 @@ class Block:
         
     # draw the cube
     def draw(self, win):
+        import pygame
         pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.width))
 
 # initialize the grid  
@@ -75,6 +85,7 @@ def make_grid(num_rows, width):
     return grid
 
 def draw_grid(win, num_rows, width):
+    import pygame
     gap = width // num_rows
     for i in range(num_rows):
         # draw a horizontal line to separate every row
@@ -86,6 +97,7 @@ def draw_grid(win, num_rows, width):
 
 # draw the grids and each spots
 def draw(win, grid, num_rows, width):
+    import pygame
     win.fill(WHITE)
     
     for row in grid:
@@ -144,6 +156,7 @@ def moveUp(cur, grid):
 
 # --------------------- NEURAL NETWORK SECTION -----------------------------
 def solveNN(draw, grid, start, end, num_rows):
+    import pygame
     cur = start
     step_counter = 0
 
@@ -171,7 +184,7 @@ def solveNN(draw, grid, start, end, num_rows):
         
         
 def main(win, width):
-    pygame.init()
+    import pygame
     num_rows = 30
     grid = make_grid(num_rows, width)
     
@@ -235,6 +248,24 @@ def main(win, width):
                     solveNN(lambda:draw(win, grid, num_rows, width), grid, start, end, num_rows)
                     finished = True
                 
+                # Click a to show the shortest route found by A*
+                if event.key == pygame.K_a and not started and start and end:
+                    barriers = np.array([[block.is_barrier() for block in row] for row in grid])
+                    route = astar(barriers, (start.row, start.col), (end.row, end.col))
+                    if route is None:
+                        print("No route between start and end")
+                    else:
+                        for x, y in route:
+                            grid[x][y].make_path()
+                        print("A* route of", len(route) - 1, "steps")
+                        started = True
+                        finished = True
+
+                # Click m to save the painted barriers as a map for training
+                if event.key == pygame.K_m:
+                    save_map("barriers.npy", [[block.is_barrier() for block in row] for row in grid])
+                    print("Saved barrier map to barriers.npy")
+
                 # Click escape to restart the grid
                 if event.key == pygame.K_ESCAPE and started:
                     # reset and empty grid
@@ -242,7 +273,6 @@ def main(win, width):
                         for k in range(num_rows):
                             block = grid[i][k]
                             block.reset()
-                            block.set_score('')
                     draw(win, grid, num_rows, width)
                     started = False
                     finished = False
@@ -251,4 +281,4 @@ def main(win, width):
     pygame.quit()
     
 if __name__ == "__main__":
-    main(WIN, WIDTH)
+    main(open_window(WIDTH, "Pathfinding with A* Algorithm"), WIDTH)
@@ -0,0 +1,72 @@
+import functools
+import numpy as np
+
+# network inputs are ordered (up, down, right, left) while the outputs are
+# (up, down, left, right); this maps an output direction to its input column
+DIRECTION_INPUT = np.array([0, 1, 3, 2])
+
+# distance gained towards the target by a step up, down, right and left, for
+# agents at offset (dx, dy) = (x - end_x, y - end_y); works on arrays
+def sensor_inputs(dx, dy):
+    d = np.sqrt(dx**2 + dy**2)
+    return np.stack((d - np.sqrt(dx**2 + (dy-1)**2),
+                     d - np.sqrt(dx**2 + (dy+1)**2),
+                     d - np.sqrt((dx+1)**2 + dy**2),
+                     d - np.sqrt((dx-1)**2 + dy**2)), axis=-1)
+
+# length of the shortest route to the target on an open grid, moving up,
+# down, left and right; works on arrays
+def manhattan_distance(xs, ys, end_x, end_y):
+    return np.abs(np.subtract(xs, end_x)) + np.abs(np.subtract(ys, end_y))
+
+# Sensor inputs of every possible offset to the target on a grid, so the
+# distances are computed once per grid size instead of on every step
+class SensorTable:
+    def __init__(self, num_rows, num_cols=None):
+        if num_cols is None:
+            num_cols = num_rows
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        dx, dy = np.meshgrid(np.arange(1 - num_rows, num_rows), np.arange(1 - num_cols, num_cols), indexing='ij')
+        self.table = sensor_inputs(dx, dy)
+
+    # (..., 4) network inputs of agents at (xs, ys) heading to (end_x, end_y)
+    def inputs(self, xs, ys, end_x, end_y):
+        return self.table[xs - end_x + self.num_rows - 1, ys - end_y + self.num_cols - 1]
+
+    route_length = staticmethod(manhattan_distance)
+
+    # reward for the move just made in each output direction, i.e. half the
+    # distance the same move would gain again from the new position
+    def rewards(self, xs, ys, end_x, end_y, directions):
+        return self.table[xs - end_x + self.num_rows - 1, ys - end_y + self.num_cols - 1, DIRECTION_INPUT[directions]] / 2
+
+# Same interface as SensorTable, computing the inputs on every call; used for
+# grids whose table would not fit in memory
+class SensorFunction:
+    def __init__(self, num_rows, num_cols=None):
+        if num_cols is None:
+            num_cols = num_rows
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+
+    def inputs(self, xs, ys, end_x, end_y):
+        return sensor_inputs(np.asarray(xs - end_x, dtype=np.int64), np.asarray(ys - end_y, dtype=np.int64))
+
+    route_length = staticmethod(manhattan_distance)
+
+    def rewards(self, xs, ys, end_x, end_y, directions):
+        inputs = self.inputs(xs, ys, end_x, end_y)
+        return np.take_along_axis(inputs, DIRECTION_INPUT[directions][..., None], axis=-1)[..., 0] / 2
+
+# largest table (in offsets) built before falling back to SensorFunction
+TABLE_LIMIT = 1 << 22
+
+# tables are shared by every caller using the same grid size
+@functools.lru_cache(maxsize=16)
+def get_sensor_table(num_rows, num_cols=None):
+    if num_cols is None:
+        num_cols = num_rows
+    if (2*num_rows - 1)*(2*num_cols - 1) > TABLE_LIMIT:
+        return SensorFunction(num_rows, num_cols)
+    return SensorTable(num_rows, num_cols)
@@ -0,0 +1,163 @@
+import argparse
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+SHARED_GRID_MAGIC = 0x4E454154
+SHARED_GRID_VERSION = 1
+# header: magic, version, num_rows, tiles, slots, latest frame
+HEADER_FIELDS = 6
+# slot metadata: frame (-1 while being written), level, round
+SLOT_FIELDS = 3
+
+# int64 header, then `slots` frames of int64 metadata and (tiles, rows, rows)
+# cells, laid out in one shared memory block
+def _layout(buf, num_rows, tiles, slots):
+    header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=buf)
+    offset = header.nbytes
+    metas = []
+    cells = []
+    for _ in range(slots):
+        metas.append(np.ndarray(SLOT_FIELDS, dtype=np.int64, buffer=buf, offset=offset))
+        offset += metas[-1].nbytes
+        cells.append(np.ndarray((tiles, num_rows, num_rows), dtype=np.uint8, buffer=buf, offset=offset))
+        offset += cells[-1].nbytes
+    return header, metas, cells
+
+def _size(num_rows, tiles, slots):
+    return 8*HEADER_FIELDS + slots*(8*SLOT_FIELDS + tiles*num_rows*num_rows)
+
+# Publishes the grids of the best max_tiles genomes to a shared memory ring
+# buffer of `slots` frames on every call of the fitness loop, for a viewer in
+# another process. It has the renderer interface of the fitness loop and
+# picks the tiles at the start of every round like the training window. A
+# frame is written into the slot after the latest one and then made the
+# latest, so the trainer never waits for a reader and the cost is the same
+# whether a viewer is attached or not.
+class GridPublisher:
+    def __init__(self, name, num_rows, max_tiles=25, slots=4):
+        self.num_rows = num_rows
+        self.tiles = int(np.sqrt(max_tiles))**2
+        self.slots = slots
+        self.memory = shared_memory.SharedMemory(name=name, create=True, size=_size(num_rows, self.tiles, slots))
+        self.header, self.metas, self.cells = _layout(self.memory.buf, num_rows, self.tiles, slots)
+        self.header[:] = [SHARED_GRID_MAGIC, SHARED_GRID_VERSION, num_rows, self.tiles, slots, -1]
+        for meta in self.metas:
+            meta[:] = -1
+        self.frame = -1
+        self.round = 0
+        self.agents = None
+
+    def _publish(self, grid, level):
+        self.frame += 1
+        slot = self.frame % self.slots
+        meta = self.metas[slot]
+        meta[0] = -1
+        cells = self.cells[slot]
+        np.take(grid.cells, self.agents, axis=0, out=cells[:len(self.agents)])
+        meta[1] = level
+        meta[2] = self.round
+        meta[0] = self.frame
+        self.header[5] = self.frame
+
+    def on_round(self, grid, level, fitness=None):
+        count = min(self.tiles, grid.pop_size)
+        if fitness is None:
+            self.agents = np.arange(count)
+        else:
+            self.agents = np.argsort(-fitness, kind='stable')[:count]
+        self.round += 1
+        # tiles without a genome stay empty
+        for cells in self.cells:
+            cells[count:] = 0
+        self._publish(grid, level)
+
+    def on_step(self, grid, level):
+        self._publish(grid, level)
+
+    def close(self):
+        self.header[5] = -1
+        del self.header, self.metas, self.cells
+        self.memory.close()
+        self.memory.unlink()
+
+# Reader side of GridPublisher. latest() returns the newest frame as
+# (frame, level, round, cells) where cells is a view into the shared memory,
+# not a copy; still_valid() tells whether the publisher has since started
+# overwriting that slot, in which case whatever was read from it is torn.
+class GridReader:
+    def __init__(self, name):
+        self.memory = shared_memory.SharedMemory(name=name)
+        # the publisher owns the block; without this the resource tracker
+        # would remove it when the viewer exits
+        resource_tracker.unregister(self.memory._name, 'shared_memory')
+        header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=self.memory.buf)
+        if header[0] != SHARED_GRID_MAGIC or header[1] != SHARED_GRID_VERSION:
+            raise ValueError("{0} is not a shared grid buffer".format(name))
+        self.num_rows, self.tiles, self.slots = header[2:5].tolist()
+        self.header, self.metas, self.cells = _layout(self.memory.buf, self.num_rows, self.tiles, self.slots)
+
+    def latest(self):
+        frame = int(self.header[5])
+        if frame < 0:
+            return None
+        slot = frame % self.slots
+        level, round_counter = self.metas[slot][1:].tolist()
+        if not self.still_valid(frame):
+            return None
+        return frame, level, round_counter, self.cells[slot]
+
+    def still_valid(self, frame):
+        return self.metas[frame % self.slots][0] == frame
+
+    def close(self):
+        del self.header, self.metas, self.cells
+        self.memory.close()
+
+# what the training window expects of a population grid, over a shared frame
+class SharedFrame:
+    def __init__(self, cells):
+        self.cells = cells
+        self.pop_size = len(cells)
+
+# Show a published training run in its own window with the training window's
+# look. Drawing takes far longer than the trainer takes to go around the
+# ring, so the few kilobytes of the newest frame are copied out first and
+# dropped if the slot was overwritten meanwhile; frames that arrive faster
+# than fps are skipped.
+def view(name, width=900, fps=60):
+    from training_renderer import TrainingRenderer
+    reader = GridReader(name)
+    renderer = TrainingRenderer(width, reader.num_rows, reader.tiles, fps, reader.tiles)
+    shown_frame = None
+    shown_round = None
+    try:
+        while not renderer.closed:
+            latest = reader.latest()
+            if latest is None or latest[0] == shown_frame:
+                # the run has ended
+                if reader.header[5] == -1 and shown_frame is not None:
+                    break
+                time.sleep(1.0 / fps)
+                continue
+            frame, level, round_counter, cells = latest
+            cells = cells.copy()
+            if not reader.still_valid(frame):
+                continue
+            if round_counter != shown_round:
+                renderer.on_round(SharedFrame(cells), level)
+            else:
+                renderer.on_step(SharedFrame(cells), level)
+            shown_frame = frame
+            shown_round = round_counter
+    finally:
+        renderer.close()
+        reader.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a training run started with --publish")
+    parser.add_argument("--name", default="pathfinder", help="name of the shared memory block given to --publish")
+    parser.add_argument("--width", type=int, default=900)
+    parser.add_argument("--fps", type=int, default=60)
+    args = parser.parse_args()
+    view(args.name, args.width, args.fps)
@@ -0,0 +1,120 @@
+import csv
+import json
+import time
+import neat
+
+# sections of the fitness loop timed by StepTimer
+SECTIONS = ['inference', 'environment', 'render']
+
+# Wall-clock time spent in each section of the fitness loop, with the number
+# of lockstep steps, agent steps and agents alive at the start of every
+# round. simulate() calls lap() after each section; a fitness loop without a
+# timer skips all of it.
+class StepTimer:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(SECTIONS, 0.0)
+        self.steps = 0
+        self.agent_steps = 0
+        self.alive = []
+        self.last = None
+
+    # start timing the next section
+    def start(self):
+        self.last = time.perf_counter()
+
+    # charge the time since the last lap to a section
+    def lap(self, section):
+        now = time.perf_counter()
+        self.seconds[section] += now - self.last
+        self.last = now
+
+    # add the counts of a timer that ran in a worker process
+    def merge(self, other):
+        for section in SECTIONS:
+            self.seconds[section] += other.seconds[section]
+        self.steps += other.steps
+        self.agent_steps += other.agent_steps
+        for i, count in enumerate(other.alive):
+            if i < len(self.alive):
+                self.alive[i] += count
+            else:
+                self.alive.append(count)
+
+# Reporter writing the cost of every generation to a JSON-lines file, or a
+# CSV file when the path ends in .csv: wall time of the generation, of the
+# evaluation and of the loop sections inside it, of reproduction and of
+# speciation, steps per second and agents alive per round. Reproduction and
+# speciation have no reporter hooks of their own, so the population's
+# methods are wrapped to time them. With worker processes the section times
+# are summed over the workers.
+class TimingReporter(neat.reporting.BaseReporter):
+    def __init__(self, population, path, timer):
+        self.path = path
+        self.timer = timer
+        self.csv = path.endswith('.csv')
+        self.file = open(path, 'w', newline='')
+        self.writer = None
+        self.generation = None
+        self.generation_start = None
+        self.evaluation = 0.0
+        self.reproduction = 0.0
+        self.speciation = 0.0
+        population.reproduction.reproduce = self._timed(population.reproduction.reproduce, 'reproduction')
+        population.species.speciate = self._timed(population.species.speciate, 'speciation')
+
+    def _timed(self, method, name):
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                setattr(self, name, getattr(self, name) + time.perf_counter() - t)
+        return timed
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.timer.reset()
+        self.reproduction = 0.0
+        self.speciation = 0.0
+        self.generation_start = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.evaluation = time.perf_counter() - self.generation_start
+
+    def end_generation(self, config, population, species_set):
+        timer = self.timer
+        wall = time.perf_counter() - self.generation_start
+        record = {
+            'generation': self.generation,
+            'wall_s': wall,
+            'evaluation_s': self.evaluation,
+            'inference_s': timer.seconds['inference'],
+            'environment_s': timer.seconds['environment'],
+            'render_s': timer.seconds['render'],
+            'reproduction_s': self.reproduction,
+            'speciation_s': self.speciation,
+            'steps': timer.steps,
+            'agent_steps': timer.agent_steps,
+            'steps_per_s': timer.steps / self.evaluation if self.evaluation > 0 else 0.0,
+            'agent_steps_per_s': timer.agent_steps / self.evaluation if self.evaluation > 0 else 0.0,
+            'rounds': len(timer.alive),
+            'alive_mean': sum(timer.alive) / len(timer.alive) if timer.alive else 0.0,
+        }
+        self.write(record)
+
+    def write(self, record):
+        if self.csv:
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(record))
+                self.writer.writeheader()
+            self.writer.writerow(record)
+        else:
+            record = dict(record, alive_per_round=self.timer.alive)
+            self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,164 @@
+import math
+import numpy as np
+import pygame
+
+from pathfinder_env import WHITE, BLACK, GREY, BLUE, EMPTY, STATE_COLORS
+
+# draw every separating line of the combined grid
+def draw_grid(win, comb_rows, width, num_rows):
+    gap = width // (comb_rows)
+    for i in range(comb_rows):
+        # draw a horizontal line to separate every row
+        if i % num_rows == 0:
+            pygame.draw.line(win, BLUE, (0, i*gap), (width, i*gap))
+        else:
+            pygame.draw.line(win, GREY, (0, i*gap), (width, i*gap))
+
+    for j in range(comb_rows):
+        # draw a vertical line to separate every column
+        if j % num_rows == 0:
+            pygame.draw.line(win, BLUE, (j*gap, 0), (j*gap, width))
+        else:
+            pygame.draw.line(win, GREY, (j*gap, 0), (j*gap, width))
+
+# draw the grids and each spots
+def draw(win, comb_cells, comb_rows, width, num_rows, level, font):
+    win.fill(WHITE)
+    gap = width // comb_rows
+
+    for i in range(comb_rows):
+        for j in range(comb_rows):
+            color = STATE_COLORS[comb_cells[i][j]]
+            pygame.draw.rect(win, color, (i*gap, j*gap, gap, gap))
+
+    draw_grid(win, comb_rows, width, num_rows)
+    text = font.render("Score: " + str(level), 1, BLACK)
+    win.blit(text, (width - 10 - text.get_width(), 10))
+    pygame.display.update()
+
+
+# white background with every separating line, drawn once and blitted back
+# whenever the whole window has to be repainted
+def make_background(comb_rows, width, num_rows):
+    background = pygame.Surface((width, width))
+    background.fill(WHITE)
+    draw_grid(background, comb_rows, width, num_rows)
+    return background
+
+
+# Observer that shows the population grids while the fitness loop runs.
+# The fitness loop calls it once per round and once per step; it owns the
+# window, the font and the frame clock so headless runs never touch pygame.
+#
+# However large the population, at most max_tiles grids are shown: at the
+# start of every round the genomes with the highest fitness so far are picked
+# and tiled, best first, and followed until the round ends.
+#
+# Only the first round of a level repaints the whole window. On every step the
+# grid state is compared with the last frame and only the blocks that changed
+# are filled in, inside the cached grid lines, and pushed to the display.
+class TrainingRenderer:
+    def __init__(self, width, num_rows, pop_size, fps=90, max_tiles=25):
+        pygame.init()
+        pygame.font.init()
+        self.width = width
+        self.num_rows = num_rows
+        self.fps = fps
+        # fewer tiles on large grids, so every block keeps a few pixels
+        self.comb_grid_count = max(1, min(int(math.sqrt(min(pop_size, max_tiles))), width // (4*num_rows)))
+        self.comb_rows = self.comb_grid_count*num_rows
+        self.gap = width // self.comb_rows
+        self.font = pygame.font.SysFont("comicsans", 50)
+        self.win = pygame.display.set_mode((width, width))
+        pygame.display.set_caption("Pathfinding NEAT Genetic Algorithm")
+        self.background = make_background(self.comb_rows, width, num_rows)
+        self.clock = pygame.time.Clock()
+        self.closed = False
+        self.shown = None
+        self.agents = None
+        self.level = None
+        self.text = None
+        self.text_rect = None
+
+    # pixel rectangles (inside the grid lines) of the given blocks
+    def _block_rects(self, agents, xs, ys):
+        cols = (agents % self.comb_grid_count)*self.num_rows + xs
+        rows = (agents // self.comb_grid_count)*self.num_rows + ys
+        return [pygame.Rect(i*self.gap + 1, j*self.gap + 1, self.gap - 1, self.gap - 1) for i, j in zip(cols.tolist(), rows.tolist())]
+
+    def _draw_blocks(self, cells, agents, xs, ys):
+        rects = self._block_rects(agents, xs, ys)
+        for rect, state in zip(rects, cells[agents, xs, ys].tolist()):
+            self.win.fill(STATE_COLORS[state], rect)
+        return rects
+
+    def _draw_score(self, level):
+        if level != self.level:
+            self.level = level
+            self.text = self.font.render("Score: " + str(level), 1, BLACK)
+            self.text_rect = self.text.get_rect(topright=(self.width - 10, 10))
+        self.win.blit(self.text, self.text_rect)
+
+    # the score is antialiased, so the background and blocks beneath it are
+    # restored before it is drawn again
+    def _repaint_score(self, level):
+        self.win.blit(self.background, self.text_rect, self.text_rect)
+        cols = np.arange(self.text_rect.left // self.gap, min(self.text_rect.right // self.gap + 1, self.comb_rows))
+        rows = np.arange(self.text_rect.top // self.gap, min(self.text_rect.bottom // self.gap + 1, self.comb_rows))
+        cols, rows = np.meshgrid(cols, rows)
+        agents = (rows // self.num_rows)*self.comb_grid_count + cols // self.num_rows
+        xs = cols % self.num_rows
+        ys = rows % self.num_rows
+        # a round can show fewer grids than there are tiles
+        visible = agents < len(self.shown)
+        agents, xs, ys = agents[visible], xs[visible], ys[visible]
+        under = self.shown[agents, xs, ys] != EMPTY
+        self.win.set_clip(self.text_rect)
+        self._draw_blocks(self.shown, agents[under], xs[under], ys[under])
+        self.win.set_clip(None)
+        self._draw_score(level)
+
+    def on_round(self, grid, level, fitness=None):
+        if self.closed:
+            return
+        count = min(self.comb_grid_count**2, grid.pop_size)
+        if fitness is None:
+            self.agents = np.arange(count)
+        else:
+            self.agents = np.argsort(-fitness, kind='stable')[:count]
+        shown = grid.cells[self.agents]
+        self.shown = shown.copy()
+
+        self.win.blit(self.background, (0, 0))
+        self._draw_blocks(shown, *shown.nonzero())
+        self._draw_score(level)
+        pygame.display.update()
+
+    def on_step(self, grid, level):
+        if self.closed:
+            return
+        self.clock.tick(self.fps)  # n ticks per second
+
+        # closing the window detaches the observer, training keeps going
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.close()
+                return
+
+        shown = grid.cells[self.agents]
+        changed = (shown != self.shown).nonzero()
+        if not len(changed[0]):
+            return
+        self.shown[changed] = shown[changed]
+        rects = self._draw_blocks(shown, *changed)
+
+        # blocks under the score cover it, so put it back on top
+        if self.text_rect.collidelist(rects) != -1:
+            self._repaint_score(level)
+            rects.append(self.text_rect)
+        pygame.display.update(rects)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            pygame.quit()